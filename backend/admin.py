@@ -1,45 +1,124 @@
+import json
+
 from django.contrib import admin
-from .models import Contact, Parameter, Category, Product, ProductInfo, ProductParameter, Shop, Order, OrderItem
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+from .models import Contact, Parameter, Category, Product, ProductInfo, ProductParameter, Shop, Order, OrderItem, \
+    ImportRun
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Пагинатор для больших таблиц. В PostgreSQL число строк берется из статистики планировщика
+        (pg_class.reltuples для всей таблицы, EXPLAIN для отфильтрованной выборки), точный COUNT(*)
+        выполняется только если оценка меньше EXACT_COUNT_LIMIT
+    """
+    EXACT_COUNT_LIMIT = 100000
+
+    @cached_property
+    def count(self):
+        if connection.vendor == 'postgresql' and hasattr(self.object_list, 'query'):
+            estimate = self.estimate()
+            if estimate >= self.EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+    def estimate(self):
+        query = self.object_list.query
+        with connection.cursor() as cursor:
+            if not query.where:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+                return max(row[0], 0) if row else 0
+            sql, params = query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+        Список без точного подсчета строк: оценка числа записей и без общего количества в поиске.
+        Сортировка по первичному ключу идет по индексу и в списке, и в автодополнении
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-pk']
 
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
     list_display = ['name', 'url', 'owner']
+    list_select_related = ['owner__user']
+    search_fields = ['name']
+    raw_id_fields = ['owner']
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', ]
+    search_fields = ['name']
+    autocomplete_fields = ['shops']
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ['name', 'category']
+    list_select_related = ['category']
+    search_fields = ['name']
+    autocomplete_fields = ['category']
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
+class ProductInfoAdmin(LargeTableAdmin):
     list_display = ['product', 'shop', 'model', 'quantity', 'price', 'price_rrc']
+    list_select_related = ['product', 'shop']
+    list_filter = ['shop']
+    search_fields = ['product__name', 'model', '=external_id']
+    autocomplete_fields = ['product', 'shop']
 
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
     list_display = ['name',]
+    search_fields = ['name']
 
 
 @admin.register(ProductParameter)
-class ProductParameterAdmin(admin.ModelAdmin):
+class ProductParameterAdmin(LargeTableAdmin):
     list_display = ['product_info', 'parameter', 'value']
+    list_select_related = ['product_info', 'parameter']
+    autocomplete_fields = ['product_info', 'parameter']
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['user', 'dt', 'status']
+    list_select_related = ['user']
+    list_filter = ['status', 'dt']
+    search_fields = ['=id', 'user__username']
+    autocomplete_fields = ['user']
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdmin):
     list_display = ['order', 'product_info', 'shop', 'quantity']
+    list_select_related = ['order__user', 'product_info', 'shop']
+    list_filter = ['shop']
+    autocomplete_fields = ['order', 'product_info', 'shop']
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'user', 'status', 'started_at', 'duration', 'queries']
+    list_select_related = ['user']
+    list_filter = ['status']
+    readonly_fields = ['user', 'file_name', 'status', 'started_at', 'duration', 'queries', 'stages', 'error', 'profile']
 
 
 # @admin.register(Contact)
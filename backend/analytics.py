@@ -0,0 +1,104 @@
+from django.db import connection, transaction
+from django.db.models import Sum, F
+from django.db.models.functions import TruncDate, Coalesce
+from django.utils import timezone
+
+from backend.models import DailySales, OrderItem, ArchivedOrder, OrderStatusChoices
+
+
+# Какие поля дневных продаж увеличивает переход заказа в статус
+ROLLUP_FIELDS = {
+    OrderStatusChoices.CONFIRMED: ('units', 'revenue'),
+    OrderStatusChoices.DELIVERED: ('delivered_units', 'delivered_revenue'),
+}
+
+COUNTERS = ('units', 'revenue', 'delivered_units', 'delivered_revenue')
+
+# Больше товаров в рейтинге продаж магазина не отдается
+MAX_TOP_PRODUCTS = 100
+
+BATCH_SIZE = 500
+
+CONFIRMED_STATUSES = [OrderStatusChoices.CONFIRMED, OrderStatusChoices.ASSEMBLED,
+                      OrderStatusChoices.SENT, OrderStatusChoices.DELIVERED]
+
+
+def add_daily_sales(rows, units_field, revenue_field):
+    """
+        Прибавляет продажи к дневным итогам одним INSERT ... ON CONFLICT на пачку строк.
+        rows - кортежи (день, магазин, категория, товар, штук, выручка)
+    """
+
+    qn = connection.ops.quote_name
+    table = qn(DailySales._meta.db_table)
+    keys = ('shop_id', 'day', 'category_id', 'product_id')
+    columns = ('day', 'shop_id', 'category_id', 'product_id') + COUNTERS
+    updates = ', '.join(f'{qn(name)} = {table}.{qn(name)} + EXCLUDED.{qn(name)}' for name in COUNTERS)
+    placeholder = f'({", ".join(["%s"] * len(columns))})'
+
+    params = []
+    for day, shop_id, category_id, product_id, units, revenue in rows:
+        counters = {units_field: units, revenue_field: revenue}
+        params.append([day, shop_id, category_id, product_id, *(counters.get(name, 0) for name in COUNTERS)])
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(params), BATCH_SIZE):
+            batch = params[start:start + BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(map(qn, columns))}) VALUES {", ".join([placeholder] * len(batch))} '
+                f'ON CONFLICT ({", ".join(map(qn, keys))}) DO UPDATE SET {updates}',
+                [value for row in batch for value in row])
+
+
+def rollup_orders(order_ids, status, day=None):
+    """
+        Учет товаров заказов в дневных продажах при подтверждении и доставке
+    """
+
+    if status not in ROLLUP_FIELDS:
+        return
+    day = day or timezone.localdate()
+
+    rows = OrderItem.objects.filter(order_id__in=order_ids, product_info__isnull=False).values_list(
+        'shop_id', 'product_info__product__category_id', 'product_info__product_id').annotate(
+        units=Sum('quantity'), revenue=Sum(F('quantity') * F('product_info__price_rrc')))
+    add_daily_sales([(day, *row) for row in rows], *ROLLUP_FIELDS[status])
+
+
+def archived_sales():
+    """
+        Подтвержденные продажи архивных заказов: (день, магазин, категория, товар, штук, выручка).
+        Позиции без id товара (предложение удалено до переноса id в архив) не учитываются
+    """
+
+    sales = {}
+    orders = ArchivedOrder.objects.filter(status__in=CONFIRMED_STATUSES).values_list('confirmed_at', 'dt', 'items')
+    for confirmed_at, dt, items in orders.iterator(chunk_size=BATCH_SIZE):
+        day = timezone.localdate(confirmed_at or dt)
+        for item in items:
+            product_info = item.get('product_info') or {}
+            product = product_info.get('product') or {}
+            shop_id = (item.get('shop') or {}).get('id')
+            if product.get('id') is None or product.get('category') is None or shop_id is None:
+                continue
+            key = (day, shop_id, product['category'], product['id'])
+            units, revenue = sales.get(key, (0, 0))
+            sales[key] = (units + item['quantity'], revenue + item['quantity'] * (product_info.get('price_rrc') or 0))
+    return [(*key, units, revenue) for key, (units, revenue) in sales.items()]
+
+
+def rebuild_daily_sales():
+    """
+        Полный пересчет подтвержденных продаж по дате подтверждения заказов, вместе с архивными;
+        у заказов без даты подтверждения берется дата заказа
+    """
+
+    rows = OrderItem.objects.filter(product_info__isnull=False, order__status__in=CONFIRMED_STATUSES).annotate(
+        day=TruncDate(Coalesce('order__confirmed_at', 'order__dt'))).values_list(
+        'day', 'shop_id', 'product_info__product__category_id', 'product_info__product_id').annotate(
+        units=Sum('quantity'), revenue=Sum(F('quantity') * F('product_info__price_rrc'))).order_by()
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        # Строки одного дня и товара из живых и архивных заказов складываются в add_daily_sales
+        add_daily_sales(rows, *ROLLUP_FIELDS[OrderStatusChoices.CONFIRMED])
+        add_daily_sales(archived_sales(), *ROLLUP_FIELDS[OrderStatusChoices.CONFIRMED])
@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models import Sum, F
+
+from backend.fast_serializers import order_detail_data
+from backend.fieldsets import ARCHIVED_ORDER_ITEM_FIELDS, Fieldset
+from backend.models import Order, ArchivedOrder, OrderStatusChoices
+from backend.partitions import ensure_month_partition
+
+
+ARCHIVE_STATUSES = [OrderStatusChoices.DELIVERED, OrderStatusChoices.CANCELED]
+
+ARCHIVED_ORDER_FIELDS = Fieldset({'id': None, 'order_items': ARCHIVED_ORDER_ITEM_FIELDS})
+
+
+def archive_orders(before, batch_size=500):
+    """
+        Переносит доставленные и отмененные заказы старше before в архив пачками.
+        Возвращает количество перенесенных заказов
+    """
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+                status__in=ARCHIVE_STATUSES, dt__lt=before).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                break
+
+            orders = Order.objects.filter(id__in=order_ids).annotate(
+                total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc')))
+            items = {order['id']: order['order_items'] for order in order_detail_data(orders, ARCHIVED_ORDER_FIELDS)}
+            rows = list(orders.values_list('id', 'user_id', 'dt', 'status', 'confirmed_at', 'total_sum'))
+
+            for dt in {(dt.year, dt.month): dt for _, _, dt, *_ in rows}.values():
+                ensure_month_partition(ArchivedOrder, dt)
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(id=order_id, user_id=user_id, dt=dt, status=status, confirmed_at=confirmed_at,
+                              total_sum=total_sum, items=items[order_id])
+                for order_id, user_id, dt, status, confirmed_at, total_sum in rows])
+            Order.objects.filter(id__in=order_ids).delete()
+        archived += len(order_ids)
+    return archived
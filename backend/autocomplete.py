@@ -0,0 +1,217 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count
+
+from backend.models import Product, ProductInfo, OrderItem, CatalogChange, OrderStatusChoices
+
+
+# Результаты для коротких префиксов, под которые попадает много товаров, запоминаются
+CACHED_PREFIX_LENGTH = 3
+
+MAX_LIMIT = 20
+
+# Если изменилось больше товаров, индекс строится заново, а не обновляется по одному
+REBUILD_THRESHOLD = 5000
+
+WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(WORD.findall(str(text).casefold().replace('ё', 'е')))
+
+
+def phrase_keys(text):
+    """ Ключи для поиска с начала любого слова: "apple iphone xs", "iphone xs", "xs" """
+    words = normalize(text).split()
+    return {' '.join(words[start:]) for start in range(len(words))}
+
+
+class ProductPrefixIndex:
+    """
+        Индекс товаров внутри процесса для подсказок при вводе: отсортированный список ключей
+        (названия, модели предложений, категории) и поиск префикса через bisect.
+        Подсказки ранжируются по числу заказанных позиций товара. Строится при первом запросе
+        и догоняет журнал изменений каталога не чаще раза в AUTOCOMPLETE_SYNC_INTERVAL секунд
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.key_products = []
+        self.products = {}
+        self.product_keys = {}
+        self.popularity = {}
+        # Предложения индексированных товаров: по ним изменения журнала каталога, в том числе удаления,
+        # сопоставляются с товарами без запросов к базе
+        self.offer_products = {}
+        self.product_offers = {}
+        self.revision = None
+        self.synced_at = 0
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @property
+    def built(self):
+        return self.revision is not None
+
+    def load_products(self, product_ids=None):
+        """ Товары с предложениями: id -> (данные подсказки, ключи, id предложений) """
+
+        products = Product.objects.filter(id__in=ProductInfo.objects.values('product_id'))
+        offers = ProductInfo.objects.all()
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+            offers = offers.filter(product_id__in=product_ids)
+
+        loaded = {product_id: ({'id': product_id, 'name': name, 'category': category},
+                               phrase_keys(name) | phrase_keys(category), set())
+                  for product_id, name, category in products.values_list('id', 'name', 'category__name')}
+        for product_info_id, product_id, model in offers.values_list('id', 'product_id', 'model'):
+            if product_id in loaded:
+                loaded[product_id][2].add(product_info_id)
+                if model:
+                    loaded[product_id][1].update(phrase_keys(model))
+        return loaded
+
+    @staticmethod
+    def load_popularity(product_ids=None):
+        items = OrderItem.objects.exclude(order__status=OrderStatusChoices.BASKET).filter(product_info__isnull=False)
+        if product_ids is not None:
+            items = items.filter(product_info__product_id__in=product_ids)
+        return dict(items.values_list('product_info__product_id').annotate(count=Count('id')).order_by())
+
+    def build(self):
+        revision = CatalogChange.current_revision()
+        loaded = self.load_products()
+        popularity = self.load_popularity()
+        entries = sorted((key, product_id) for product_id, (_, keys, _) in loaded.items() for key in keys)
+
+        with self._lock:
+            self.keys = [key for key, _ in entries]
+            self.key_products = [product_id for _, product_id in entries]
+            self.products = {product_id: data for product_id, (data, _, _) in loaded.items()}
+            self.product_keys = {product_id: keys for product_id, (_, keys, _) in loaded.items()}
+            self.product_offers = {product_id: offers for product_id, (_, _, offers) in loaded.items()}
+            self.offer_products = {product_info_id: product_id
+                                   for product_id, offers in self.product_offers.items() for product_info_id in offers}
+            self.popularity = popularity
+            self.revision = revision
+            self.synced_at = time.monotonic()
+            self._cache.clear()
+
+    def _invalidate(self, keys):
+        """ Убирает из кеша результаты префиксов, под которые попадают ключи """
+        for key in keys:
+            for length in range(1, CACHED_PREFIX_LENGTH + 1):
+                self._cache.pop(key[:length], None)
+
+    def _remove(self, product_id):
+        for product_info_id in self.product_offers.pop(product_id, ()):
+            if self.offer_products.get(product_info_id) == product_id:
+                del self.offer_products[product_info_id]
+        keys = self.product_keys.pop(product_id, ())
+        self._invalidate(keys)
+        for key in keys:
+            position = bisect_left(self.keys, key)
+            while self.key_products[position] != product_id:
+                position += 1
+            del self.keys[position]
+            del self.key_products[position]
+        self.products.pop(product_id, None)
+
+    def update_products(self, product_ids):
+        """ Перечитывает из базы товары, их модели и популярность """
+
+        product_ids = set(product_ids)
+        if not self.built or not product_ids:
+            return
+        if len(product_ids) > REBUILD_THRESHOLD:
+            self.build()
+            return
+
+        loaded = self.load_products(product_ids)
+        popularity = self.load_popularity(product_ids)
+        with self._lock:
+            for product_id in product_ids:
+                self._remove(product_id)
+                self.popularity[product_id] = popularity.get(product_id, 0)
+                if product_id not in loaded:
+                    continue
+                data, keys, offers = loaded[product_id]
+                self.products[product_id] = data
+                self.product_keys[product_id] = keys
+                self.product_offers[product_id] = offers
+                self.offer_products.update(dict.fromkeys(offers, product_id))
+                self._invalidate(keys)
+                for key in keys:
+                    position = bisect_left(self.keys, key)
+                    while position < len(self.keys) and self.keys[position] == key and \
+                            self.key_products[position] < product_id:
+                        position += 1
+                    self.keys.insert(position, key)
+                    self.key_products.insert(position, product_id)
+
+    def add_orders(self, order_ids):
+        """ Учитывает товары новых заказов в популярности """
+
+        ordered = OrderItem.objects.filter(order_id__in=order_ids, product_info__isnull=False).values_list(
+            'product_info__product_id').annotate(count=Count('id')).order_by()
+        with self._lock:
+            for product_id, count in ordered:
+                self.popularity[product_id] = self.popularity.get(product_id, 0) + count
+                self._invalidate(self.product_keys.get(product_id, ()))
+
+    def sync(self):
+        """
+            Строит индекс или применяет изменения каталога, сделанные после построения, в том числе другими процессами
+        """
+
+        if not self.built:
+            self.build()
+            return
+        if time.monotonic() - self.synced_at < settings.AUTOCOMPLETE_SYNC_INTERVAL:
+            return
+
+        revision = CatalogChange.current_revision()
+        if revision != self.revision:
+            changed = set(CatalogChange.objects.filter(id__gt=self.revision, id__lte=revision).values_list(
+                'product_info_id', flat=True))
+            # Прежние товары измененных и удаленных предложений известны индексу, текущие - из базы
+            with self._lock:
+                product_ids = {self.offer_products[pk] for pk in changed if pk in self.offer_products}
+            product_ids |= set(ProductInfo.objects.filter(id__in=changed).values_list('product_id', flat=True))
+            self.update_products(product_ids)
+            self.revision = revision
+        self.synced_at = time.monotonic()
+
+    def search(self, text, limit=10):
+        """ Товары, в названии, модели или категории которых есть слово, начинающееся с text """
+
+        prefix = normalize(text)
+        if text[-1:].isspace() and prefix:
+            prefix += ' '
+        if not prefix:
+            return []
+        limit = min(limit, MAX_LIMIT)
+
+        with self._lock:
+            found = self._cache.get(prefix)
+            if found is None:
+                product_ids = set()
+                for position in range(bisect_left(self.keys, prefix), len(self.keys)):
+                    if not self.keys[position].startswith(prefix):
+                        break
+                    product_ids.add(self.key_products[position])
+                found = heapq.nlargest(MAX_LIMIT, product_ids,
+                                       key=lambda product_id: (self.popularity.get(product_id, 0), -product_id))
+                if len(prefix) <= CACHED_PREFIX_LENGTH:
+                    self._cache[prefix] = found
+            return [{**self.products[product_id], 'orders': self.popularity.get(product_id, 0)}
+                    for product_id in found[:limit]]
+
+
+product_index = ProductPrefixIndex()
@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Sum, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from backend.fast_serializers import order_detail_data, datetime_field
+from backend.models import Order, OrderItem, ProductInfo
+from backend.serializers import OrderItemSerializer
+from backend.stock import reserve_items
+
+
+class DatabaseBasket:
+    """
+        Корзина в таблицах Order/OrderItem: каждое изменение сразу пишется в базу
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def add(self, product_info_id, product_id, shop_id, quantity):
+        basket, _ = Order.objects.get_or_create(user=self.user, status='BASKET')
+        OrderItem.objects.create(order=basket, product_info_id=product_info_id, shop_id=shop_id, quantity=quantity)
+        Order.objects.filter(pk=basket.pk).update(updated_at=timezone.now())
+
+    def data(self):
+        basket = Order.objects.filter(user_id=self.user.id, status='BASKET').annotate(
+            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc'))).distinct()
+        return order_detail_data(basket)
+
+    def update(self, product_id, data):
+        order_item = OrderItem.objects.get(order__user=self.user, order__status='BASKET',
+                                           product_info__product=product_id)
+        serializer = OrderItemSerializer(order_item, data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        Order.objects.filter(pk=order_item.order_id).update(updated_at=timezone.now())
+
+    def remove(self, product_id):
+        order_item = OrderItem.objects.get(order__user=self.user, order__status='BASKET',
+                                           product_info__product=product_id)
+        order_item.delete()
+        Order.objects.filter(pk=order_item.order_id).update(updated_at=timezone.now())
+
+    def checkout(self):
+        """
+            Превращает корзину в новый заказ с резервом остатков. Возвращает заказ или None, если корзины нет,
+            при нехватке товара - InsufficientStock
+        """
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(user=self.user, status='BASKET').first()
+            if order is None:
+                return None
+            reserve_items(order.order_items.values_list('product_info_id', 'quantity'))
+            order.status = 'NEW'
+            order.save()
+        return order
+
+
+class CacheBasket:
+    """
+        Корзина в кеше Django settings.BASKET_CACHE_ALIAS (в памяти процесса, в файлах, Redis и т.д.).
+        В Order/OrderItem попадает только при оформлении заказа
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.cache = caches[settings.BASKET_CACHE_ALIAS]
+        self.key = f'basket:{user.id}'
+
+    def load(self):
+        return self.cache.get(self.key)
+
+    def save(self, basket):
+        self.cache.set(self.key, basket, settings.BASKET_CACHE_TIMEOUT)
+
+    def add(self, product_info_id, product_id, shop_id, quantity):
+        serializer = OrderItemSerializer(data={'quantity': quantity}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        basket = self.load() or {'dt': timezone.now(), 'items': []}
+        basket['items'].append({'product_info_id': product_info_id, 'product_id': product_id,
+                                'shop_id': shop_id, 'quantity': serializer.validated_data['quantity']})
+        self.save(basket)
+
+    def find(self, basket, product_id):
+        for item in basket['items'] if basket else []:
+            if str(item['product_id']) == str(product_id):
+                return item
+        raise ObjectDoesNotExist
+
+    def data(self):
+        basket = self.load()
+        if basket is None:
+            return []
+
+        offers = {pk: rest for pk, *rest in ProductInfo.objects.filter(
+            id__in=[item['product_info_id'] for item in basket['items']]).values_list(
+            'id', 'product__name', 'price_rrc', 'shop__name', 'shop__url')}
+        order_items = []
+        total_sum = None
+        for item in basket['items']:
+            product_name, price_rrc, shop_name, shop_url = offers.get(item['product_info_id'], (None,) * 4)
+            order_items.append({
+                'product_info': {'id': item['product_info_id'], 'product': {'name': product_name},
+                                 'price_rrc': price_rrc},
+                'quantity': item['quantity'],
+                'shop': {'name': shop_name, 'url': shop_url},
+            })
+            if price_rrc is not None:
+                total_sum = (total_sum or 0) + item['quantity'] * price_rrc
+
+        return [{
+            'id': None,
+            'order_items': order_items,
+            'status': 'BASKET',
+            'dt': datetime_field.to_representation(basket['dt']),
+            'total_sum': total_sum,
+        }]
+
+    def update(self, product_id, data):
+        basket = self.load()
+        item = self.find(basket, product_id)
+        serializer = OrderItemSerializer(data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        item['quantity'] = serializer.validated_data.get('quantity', item['quantity'])
+        self.save(basket)
+
+    def remove(self, product_id):
+        basket = self.load()
+        item = self.find(basket, product_id)
+        basket['items'].remove(item)
+        self.save(basket)
+
+    def checkout(self):
+        """ Записывает корзину в Order/OrderItem как новый заказ """
+        basket = self.load()
+        if basket is None:
+            return None
+        with transaction.atomic():
+            reserve_items((item['product_info_id'], item['quantity']) for item in basket['items'])
+            order = Order.objects.create(user=self.user, status='NEW')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_info_id=item['product_info_id'], shop_id=item['shop_id'],
+                          quantity=item['quantity']) for item in basket['items']])
+        self.cache.delete(self.key)
+        return order
+
+
+def get_basket(user):
+    """ Корзина пользователя в хранилище settings.BASKET_BACKEND """
+    return import_string(settings.BASKET_BACKEND)(user)
@@ -0,0 +1,27 @@
+import time
+
+from django.db import transaction
+
+from backend.models import Order
+
+
+def purge_baskets(idle_before, batch_size=500, pause=0.1):
+    """
+        Удаляет корзины, которые не менялись с idle_before, небольшими пачками с паузой между ними.
+        Корзины, заблокированные другими транзакциями, пропускаются.
+        Возвращает количество удаленных корзин и строк товаров
+    """
+
+    baskets = items = 0
+    while True:
+        with transaction.atomic():
+            basket_ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+                status='BASKET', updated_at__lt=idle_before).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not basket_ids:
+                break
+            _, deleted = Order.objects.filter(id__in=basket_ids).delete()
+
+        baskets += deleted.get('backend.Order', 0)
+        items += deleted.get('backend.OrderItem', 0)
+        time.sleep(pause)
+    return baskets, items
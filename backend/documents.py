@@ -0,0 +1,73 @@
+from django.db import transaction
+
+from backend.fast_serializers import product_info_data
+from backend.models import ProductInfo, ProductDocument
+
+
+BATCH_SIZE = 1000
+
+# JSONB в PostgreSQL не сохраняет порядок ключей, при чтении он восстанавливается
+DOCUMENT_KEYS = ('product', 'model', 'product_parameters', 'quantity', 'price', 'price_rrc', 'shop')
+PRODUCT_KEYS = ('id', 'name', 'category')
+SHOP_KEYS = ('id', 'name', 'url', 'state')
+
+
+def refresh_product_documents(product_info_ids, batch_size=BATCH_SIZE):
+    """
+        Пересборка документов предложений, каждая пачка - в одной транзакции. Вызывается в транзакции
+        самих изменений (signals.send_offers_changed), документы удаленных предложений удаляются каскадно
+    """
+
+    product_info_ids = sorted(set(product_info_ids))
+    for start in range(0, len(product_info_ids), batch_size):
+        batch = product_info_ids[start:start + batch_size]
+        documents = []
+        for item in product_info_data(ProductInfo.objects.filter(id__in=batch).order_by('id'), with_id=True):
+            documents.append(ProductDocument(product_info_id=item.pop('id'), document=item))
+        with transaction.atomic():
+            ProductDocument.objects.bulk_create(documents, update_conflicts=True, unique_fields=['product_info'],
+                                                update_fields=['document', 'updated_at'])
+
+
+def document_data(document):
+    """ Документ с ключами в порядке ProductInfoSerializer """
+    return {
+        **{key: document[key] for key in DOCUMENT_KEYS},
+        'product': {key: document['product'][key] for key in PRODUCT_KEYS},
+        'shop': {key: document['shop'][key] for key in SHOP_KEYS},
+    }
+
+
+def product_documents(queryset, fieldset=None):
+    """
+        Документы предложений выборки в ее порядке одним запросом. Недостающие документы
+        собираются из исходных таблиц. fieldset ограничивает поля документа
+    """
+
+    return documents_in_order(list(queryset.prefetch_related(None).values_list('id', 'document__document')), fieldset)
+
+
+def documents_in_order(rows, fieldset):
+    """
+        Документы из строк (id, документ), недостающие собираются из исходных таблиц.
+        Поля отбираются в Python: ключи JSON, извлеченные в запросе, на SQLite теряют тип строковых значений
+    """
+
+    missing = [pk for pk, document in rows if document is None]
+    built = {}
+    if missing:
+        built = {item.pop('id'): item for item in product_info_data(ProductInfo.objects.filter(id__in=missing),
+                                                                    with_id=True)}
+    documents = [document_data(document) if document is not None else built[pk] for pk, document in rows]
+    if fieldset is not None and not fieldset.full:
+        documents = [fieldset.prune(document) for document in documents]
+    return documents
+
+
+def documents_by_id(product_info_ids, fieldset=None):
+    """
+        Документы предложений в порядке product_info_ids, например страницы индекса предложений
+    """
+
+    rows = dict(ProductInfo.objects.filter(id__in=product_info_ids).values_list('id', 'document__document'))
+    return documents_in_order([(pk, rows[pk]) for pk in product_info_ids if pk in rows], fieldset)
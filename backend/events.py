@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
+
+
+# Интервал отправки комментария, который не дает закрыть простаивающее соединение
+HEARTBEAT_INTERVAL = 15
+
+
+class OrderEventBus:
+    """
+        Шина событий смены статуса заказов внутри процесса.
+        Подписка - это очередь asyncio и цикл событий, в котором ее читают
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            self._subscribers[user_id].discard(subscription)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def subscribed_users(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def publish(self, user_id, event):
+        """ Может вызываться из любого потока """
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscriptions:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт, подписка будет удалена при выходе из потока
+                pass
+
+    @staticmethod
+    def _put(queue, event):
+        # Медленный клиент теряет самые старые события, а не блокирует остальных
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+order_bus = OrderEventBus()
+
+
+async def order_event_stream(user_id):
+    subscription = order_bus.subscribe(user_id)
+    _, queue = subscription
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield f'event: order_status\ndata: {json.dumps(event, ensure_ascii=False)}\n\n'
+    finally:
+        order_bus.unsubscribe(user_id, subscription)
+
+
+async def order_events(request):
+    """
+        Поток server-sent events о смене статусов заказов покупателя и магазина.
+        Работает только при запуске через ASGI (orders/asgi.py)
+    """
+
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    try:
+        token = await Token.objects.select_related('user').aget(key=key) if keyword == 'Token' else None
+    except Token.DoesNotExist:
+        token = None
+    if token is None or not token.user.is_active:
+        return JsonResponse({'status': 'Аутентификация не пройдена'}, status=401)
+
+    return StreamingHttpResponse(order_event_stream(token.user_id), content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
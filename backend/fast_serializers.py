@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from backend.fieldsets import ORDER_FIELDS, ORDER_DETAIL_FIELDS, Fieldset, lookups, build
+from backend.models import ProductParameter, OrderItem
+
+
+# Поле используется только для форматирования даты так же, как это делает DRF
+datetime_field = serializers.DateTimeField()
+
+
+def product_info_data(queryset, with_id=False):
+    """
+        Быстрое чтение списка товаров без ProductInfoSerializer.
+        Результат совпадает с ProductInfoSerializer(queryset, many=True).data,
+        with_id добавляет в каждый товар id предложения
+    """
+
+    rows = list(queryset.prefetch_related(None).values_list(
+        'id', 'product_id', 'product__name', 'product__category__name', 'model', 'quantity', 'price',
+        'price_rrc', 'shop_id', 'shop__name', 'shop__url', 'shop__state'))
+
+    parameters = defaultdict(list)
+    for product_info_id, name, value in ProductParameter.objects.filter(
+            product_info__in=queryset.values('id')).order_by('id').values_list(
+            'product_info_id', 'parameter__name', 'value'):
+        parameters[product_info_id].append(f'{name}: {value}')
+
+    data = [{
+        'product': {'id': product_id, 'name': product_name, 'category': category_name},
+        'model': model,
+        'product_parameters': parameters[product_info_id],
+        'quantity': quantity,
+        'price': price,
+        'price_rrc': price_rrc,
+        'shop': {'id': shop_id, 'name': shop_name, 'url': shop_url, 'state': shop_state},
+    } for (product_info_id, product_id, product_name, category_name, model, quantity, price, price_rrc,
+           shop_id, shop_name, shop_url, shop_state) in rows]
+
+    if with_id:
+        return [{'id': row[0], **item} for row, item in zip(rows, data)]
+    return data
+
+
+ORDER_COLUMNS = {
+    'id': 'id',
+    'status': 'status',
+    'dt': 'dt',
+    'total_sum': 'total_sum',
+}
+
+ORDER_ITEM_COLUMNS = {
+    'product_info': 'product_info_id',
+    'product_info.id': 'product_info_id',
+    'product_info.product': 'product_info__product_id',
+    'product_info.product.id': 'product_info__product_id',
+    'product_info.product.name': 'product_info__product__name',
+    'product_info.product.category': 'product_info__product__category_id',
+    'product_info.price_rrc': 'product_info__price_rrc',
+    'quantity': 'quantity',
+    'shop': 'shop_id',
+    'shop.id': 'shop_id',
+    'shop.name': 'shop__name',
+    'shop.url': 'shop__url',
+}
+
+CONVERT = {'dt': datetime_field.to_representation}
+
+
+def order_data(queryset, fieldset=None):
+    """
+        Быстрое чтение списка заказов без OrderSerializer.
+        queryset должен содержать аннотацию total_sum, если она выбрана в fieldset
+    """
+
+    tree = ORDER_FIELDS if fieldset is None else fieldset.tree
+    return [build(tree, row, ORDER_COLUMNS, CONVERT)
+            for row in queryset.prefetch_related(None).values(*lookups(tree, ORDER_COLUMNS))]
+
+
+def order_detail_data(queryset, fieldset=None):
+    """
+        Быстрое чтение заказов с товарами без OrderDetailSerializer. Читаются только столбцы
+        и связанные таблицы полей, выбранных в fieldset.
+        queryset должен содержать аннотацию total_sum, если она выбрана
+    """
+
+    tree = ORDER_DETAIL_FIELDS if fieldset is None else fieldset.tree
+    order_tree = {key: node for key, node in tree.items() if key != 'order_items'}
+    orders = list(queryset.prefetch_related(None).values('id', *lookups(order_tree, ORDER_COLUMNS)))
+
+    items = defaultdict(list)
+    if 'order_items' in tree:
+        item_tree = tree['order_items']
+        for row in OrderItem.objects.filter(order_id__in=[order['id'] for order in orders]).order_by('id').values(
+                'order_id', *lookups(item_tree, ORDER_ITEM_COLUMNS)):
+            items[row['order_id']].append(build(item_tree, row, ORDER_ITEM_COLUMNS))
+
+    result = []
+    for row in orders:
+        data = build(order_tree, row, ORDER_COLUMNS, CONVERT)
+        result.append({key: items[row['id']] if key == 'order_items' else data[key] for key in tree})
+    return result
+
+
+def archived_order_data(queryset, fieldset=None):
+    """
+        Список архивных заказов в формате order_data
+    """
+
+    tree = ORDER_FIELDS if fieldset is None else fieldset.tree
+    return [build(tree, row, ORDER_COLUMNS, CONVERT) for row in queryset.values(*lookups(tree, ORDER_COLUMNS))]
+
+
+def archived_order_detail_data(queryset, fieldset=None):
+    """
+        Архивные заказы с товарами в формате order_detail_data. Позиции хранятся с id товара,
+        категории и магазина (ARCHIVED_ORDER_ITEM_FIELDS), в ответе остаются только выбранные поля.
+        В позициях, где id не удалось восстановить, свернутые product и shop отдаются как None
+    """
+
+    fieldset = fieldset or Fieldset(ORDER_DETAIL_FIELDS)
+    tree = fieldset.tree
+    order_tree = {key: node for key, node in tree.items() if key != 'order_items'}
+    fields = lookups(order_tree, ORDER_COLUMNS) + (['items'] if 'order_items' in tree else [])
+
+    result = []
+    for row in queryset.values(*fields):
+        data = build(order_tree, row, ORDER_COLUMNS, CONVERT)
+        if 'order_items' in tree:
+            row['items'] = [fieldset.prune(item, tree['order_items']) for item in row['items']]
+        result.append({key: row['items'] if key == 'order_items' else data[key] for key in tree})
+    return result
@@ -0,0 +1,183 @@
+from rest_framework import serializers
+
+
+# Вложенный объект, который не разворачивается, отдается своим id
+COLLAPSED = 'id'
+
+
+class Many(dict):
+    """ Список вложенных объектов: не сворачивается до id, поля выбираются у каждого элемента """
+
+
+# Поля ответов: имя -> None для простого поля или словарь полей вложенного объекта
+PRODUCT_INFO_FIELDS = {
+    'product': {'id': None, 'name': None, 'category': None},
+    'model': None,
+    'product_parameters': None,
+    'quantity': None,
+    'price': None,
+    'price_rrc': None,
+    'shop': {'id': None, 'name': None, 'url': None, 'state': None},
+}
+
+ORDER_FIELDS = {
+    'id': None,
+    'status': None,
+    'dt': None,
+    'total_sum': None,
+}
+
+ORDER_DETAIL_FIELDS = {
+    'id': None,
+    'order_items': Many({
+        'product_info': {'id': None, 'product': {'name': None}, 'price_rrc': None},
+        'quantity': None,
+        'shop': {'name': None, 'url': None},
+    }),
+    'status': None,
+    'dt': None,
+    'total_sum': None,
+}
+
+
+# Позиции архивного заказа: поля ответа API заказов и id товара, категории и магазина
+# для сводок продаж и рекомендаций. В ответе архивного заказа лишние поля отбрасываются
+ARCHIVED_ORDER_ITEM_FIELDS = Many({
+    'product_info': {'id': None, 'product': {'id': None, 'name': None, 'category': None}, 'price_rrc': None},
+    'quantity': None,
+    'shop': {'id': None, 'name': None, 'url': None},
+})
+
+
+def split(value):
+    return None if value is None else {item.strip() for item in value.split(',') if item.strip()}
+
+
+class Fieldset:
+    """
+        Поля ответа, выбранные параметрами запроса. fields - пути полей через запятую (price, product.name),
+        без него отдаются все поля. expand - вложенные объекты, которые разворачиваются, остальные
+        отдаются своим id; без expand разворачиваются все. Явно запрошенные поля объекта его разворачивают
+    """
+
+    def __init__(self, shape, fields=None, expand=None):
+        self.shape = shape
+        self.fields = fields
+        self.expand = expand
+        for path in fields or ():
+            if self.node(shape, path) is None:
+                raise ValueError(f'Неизвестное поле {path}')
+        for path in expand or ():
+            node = self.node(shape, path)
+            if not isinstance(node, dict) or isinstance(node, Many):
+                raise ValueError(f'Поле {path} нельзя развернуть')
+        self.full = fields is None and expand is None
+        self.tree = self.select(shape, '')
+
+    @classmethod
+    def from_request(cls, request, shape):
+        return cls(shape, split(request.query_params.get('fields')), split(request.query_params.get('expand')))
+
+    @staticmethod
+    def node(shape, path):
+        node = shape
+        for key in path.split('.'):
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node if node is not None else True
+
+    def requested(self, path):
+        if self.fields is None:
+            return True
+        return any(path == field or path.startswith(field + '.') or field.startswith(path + '.')
+                   for field in self.fields)
+
+    def expanded(self, path):
+        if self.expand is None or path in self.expand:
+            return True
+        return any(field.startswith(path + '.') for field in self.fields or ())
+
+    def select(self, shape, prefix):
+        tree = type(shape)()
+        for key, node in shape.items():
+            path = prefix + key
+            if not self.requested(path):
+                continue
+            if node is None:
+                tree[key] = None
+            elif isinstance(node, Many) or self.expanded(path):
+                tree[key] = self.select(node, path + '.')
+            else:
+                tree[key] = COLLAPSED
+        return tree
+
+    def prune(self, data, tree=None):
+        """ Оставляет в готовом ответе только выбранные поля """
+        tree = self.tree if tree is None else tree
+        pruned = {}
+        for key, node in tree.items():
+            value = data.get(key)
+            if node == COLLAPSED:
+                value = value.get('id') if isinstance(value, dict) else value
+            elif isinstance(node, Many):
+                value = [self.prune(item, node) for item in value or ()]
+            elif isinstance(node, dict) and value is not None:
+                value = self.prune(value, node)
+            pruned[key] = value
+        return pruned
+
+
+def lookups(tree, columns, prefix=''):
+    """ Поля модели для выбранных полей ответа; columns - путь поля ответа -> поле модели """
+    result = []
+    for key, node in tree.items():
+        path = prefix + key
+        if path in columns:
+            result.append(columns[path])
+        if isinstance(node, dict):
+            result += lookups(node, columns, path + '.')
+    return list(dict.fromkeys(result))
+
+
+def build(tree, row, columns, convert=None, prefix=''):
+    """
+        Ответ по строке values(): вложенный объект, поле id которого пусто, отдается как None
+    """
+    data = {}
+    for key, node in tree.items():
+        path = prefix + key
+        if isinstance(node, dict):
+            if path in columns and row[columns[path]] is None:
+                data[key] = None
+            else:
+                data[key] = build(node, row, columns, convert, path + '.')
+        else:
+            value = row[columns[path]]
+            data[key] = convert[path](value) if convert and path in convert and value is not None else value
+    return data
+
+
+def prune_serializer(serializer, tree):
+    """ Убирает из сериализатора невыбранные поля, свернутые вложенные сериализаторы заменяет на id """
+    for name in list(serializer.fields):
+        if name not in tree:
+            serializer.fields.pop(name)
+        elif tree[name] == COLLAPSED:
+            serializer.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        elif isinstance(tree[name], dict):
+            child = getattr(serializer.fields[name], 'child', serializer.fields[name])
+            if isinstance(child, serializers.Serializer):
+                prune_serializer(child, tree[name])
+
+
+class FieldsetSerializerMixin:
+    """
+        Сериализатор, поля которого ограничиваются Fieldset из context['fieldset']
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get('fieldset')
+        if fieldset is not None and not fieldset.full:
+            prune_serializer(self, fieldset.tree)
@@ -0,0 +1,93 @@
+import cProfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+from backend.models import ImportRun, ImportStatusChoices
+
+
+class ImportProfiler:
+    """
+        Замер стадий загрузки прайса. Время и запросы к базе относятся к самой вложенной из открытых стадий,
+        повторные входы в стадию суммируются. Результат сохраняется в ImportRun
+    """
+
+    def __init__(self, user, file_name, profile=False):
+        self.user = user
+        self.file_name = file_name
+        self.profile = profile
+        self.run = None
+        self.status = ImportStatusChoices.DONE
+        self.seconds = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.rows = defaultdict(int)
+        self._stack = []
+        self._mark = None
+
+    def _charge(self):
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries[self._stack[-1] if self._stack else 'other'] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name):
+        self._charge()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            self._stack.pop()
+
+    def count(self, stage, rows=1):
+        self.rows[stage] += rows
+
+    def report(self):
+        return {name: {'seconds': round(self.seconds[name], 4),
+                       'queries': self.queries[name],
+                       'rows': self.rows[name]}
+                for name in dict.fromkeys([*self.seconds, *self.queries, *self.rows])}
+
+    @contextmanager
+    def start(self):
+        """
+            Загрузка целиком: создает ImportRun, считает запросы к базе и при profile пишет профиль cProfile
+            в settings.IMPORT_PROFILE_DIR (формат pstats: snakeviz, pstats, gprof2dot)
+        """
+
+        self.run = ImportRun.objects.create(user=self.user, file_name=self.file_name)
+        profiler = cProfile.Profile() if self.profile else None
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._count_query):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    yield self
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        except Exception as exc:
+            self.status = ImportStatusChoices.FAILED
+            self.run.error = repr(exc)
+            raise
+        finally:
+            if profiler is not None:
+                path = Path(settings.IMPORT_PROFILE_DIR) / f'import-{self.run.id}.prof'
+                path.parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(path)
+                self.run.profile = str(path)
+            self.run.status = self.status
+            self.run.duration = time.perf_counter() - started
+            self.run.queries = sum(self.queries.values())
+            self.run.stages = self.report()
+            self.run.save()
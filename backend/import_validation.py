@@ -0,0 +1,275 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from django.conf import settings
+
+from backend.models import Category, Shop
+
+
+MAX_LENGTH = 100
+
+MAX_INTEGER = 2 ** 31 - 1
+
+BaseLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class LineDict(dict):
+    """
+        Словарь из YAML с номером строки, с которой он начинается
+    """
+    line = None
+
+
+class LineLoader(BaseLoader):
+    """
+        Загрузчик YAML, запоминающий номера строк словарей. line_offset - номер строки файла,
+        с которой начинается разбираемый текст
+    """
+    line_offset = 0
+
+    def construct_yaml_map(self, node):
+        data = LineDict()
+        data.line = node.start_mark.line + 1 + self.line_offset
+        yield data
+        data.update(self.construct_mapping(node))
+
+
+LineLoader.add_constructor('tag:yaml.org,2002:map', LineLoader.construct_yaml_map)
+
+
+def load_yaml(text, line_offset=0):
+    loader = LineLoader(text)
+    loader.line_offset = line_offset
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+def yaml_error(exc, line_offset=0):
+    mark = getattr(exc, 'problem_mark', None)
+    return error(mark.line + 1 + line_offset if mark else None, '', f'Ошибка разбора YAML: {exc}')
+
+
+def split_goods(text, chunk_size):
+    """
+        Делит текст прайса на заголовок без товаров и куски списка goods по границам элементов,
+        чтобы разбирать их в разных процессах. Возвращает заголовок и список (смещение строк, номер первого
+        товара, текст) или None, если список goods в блочном стиле не найден или делить его не нужно
+    """
+
+    lines = text.splitlines(keepends=True)
+    start = next((number for number, line in enumerate(lines) if line.rstrip() == 'goods:'), None)
+    if start is None:
+        return None
+
+    items, indent, end = [], None, len(lines)
+    for number in range(start + 1, len(lines)):
+        line = lines[number]
+        stripped = line.lstrip(' ')
+        if not stripped.strip() or stripped.startswith('#'):
+            continue
+        current = len(line) - len(stripped)
+        if indent is None:
+            if not stripped.startswith('-'):
+                return None
+            indent = current
+        if current == 0 and not stripped.startswith('-'):
+            end = number
+            break
+        if current == indent and stripped.startswith('-'):
+            items.append(number)
+    if len(items) <= chunk_size:
+        return None
+
+    # Пустые строки на месте товаров сохраняют номера строк после списка
+    header = ''.join(lines[:start]) + 'goods: []\n' + '\n' * (end - start - 1) + ''.join(lines[end:])
+    bounds = items[::chunk_size] + [end]
+    chunks = [(first, index * chunk_size, ''.join(lines[first:last]))
+              for index, (first, last) in enumerate(zip(bounds, bounds[1:]))]
+    return header, chunks
+
+
+def error(line, path, message):
+    return {'line': line, 'path': path, 'error': message}
+
+
+def check_string(value, line, path, required=True):
+    if not isinstance(value, str) or (required and not value.strip()):
+        return [error(line, path, 'Ожидается непустая строка' if required else 'Ожидается строка')]
+    if len(value) > MAX_LENGTH:
+        return [error(line, path, f'Длина больше {MAX_LENGTH} символов')]
+    return []
+
+
+def check_integer(value, line, path):
+    # bool - подкласс int, но ценой или количеством быть не может
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= MAX_INTEGER:
+        return [error(line, path, 'Ожидается неотрицательное целое число')]
+    return []
+
+
+def check_mapping(value, line, path, keys):
+    if not isinstance(value, dict):
+        return [error(line, path, 'Ожидается словарь с полями ' + ', '.join(keys))]
+    return [error(getattr(value, 'line', line), f'{path}.{key}', 'Обязательное поле') for key in keys
+            if key not in value]
+
+
+def validate_goods(goods, category_ids, offset=0):
+    """
+        Проверка товаров без обращения к базе, поэтому может выполняться в отдельном процессе.
+        offset - номер первого товара в файле
+    """
+
+    errors = []
+    for number, item in enumerate(goods, start=offset):
+        path = f'goods[{number}]'
+        line = getattr(item, 'line', None)
+        item_errors = check_mapping(item, line, path, ('id', 'category', 'model', 'name', 'price', 'price_rrc',
+                                                       'quantity', 'parameters'))
+        if item_errors:
+            errors += item_errors
+            continue
+
+        for key in ('id', 'category', 'price', 'price_rrc', 'quantity'):
+            errors += check_integer(item[key], line, f'{path}.{key}')
+        if isinstance(item['category'], int) and item['category'] not in category_ids:
+            errors.append(error(line, f'{path}.category', f'Категория {item["category"]} не описана в categories'))
+        errors += check_string(item['name'], line, f'{path}.name')
+        errors += check_string(item['model'], line, f'{path}.model', required=False)
+
+        parameters = item['parameters']
+        if not isinstance(parameters, dict):
+            errors.append(error(line, f'{path}.parameters', 'Ожидается словарь характеристик'))
+            continue
+        for key, value in parameters.items():
+            errors += check_string(key, getattr(parameters, 'line', line), f'{path}.parameters')
+            if isinstance(value, (dict, list)) or value is None or len(str(value)) > MAX_LENGTH:
+                errors.append(error(getattr(parameters, 'line', line), f'{path}.parameters.{key}',
+                                    f'Ожидается значение длиной до {MAX_LENGTH} символов'))
+    return errors
+
+
+def load_goods_chunk(text, line_offset, index_offset, category_ids):
+    """
+        Разбор и проверка куска списка товаров в отдельном процессе
+    """
+
+    try:
+        goods = load_yaml(text, line_offset)
+    except yaml.YAMLError as exc:
+        return [], [yaml_error(exc, line_offset)]
+    if not isinstance(goods, list):
+        return [], [error(line_offset + 1, 'goods', 'Ожидается список товаров')]
+    return goods, validate_goods(goods, category_ids, index_offset)
+
+
+def load_goods_parallel(chunks, category_ids):
+    """
+        Товары больших прайсов разбираются и проверяются частями в нескольких процессах
+    """
+
+    goods, errors = [], []
+    with ProcessPoolExecutor(max_workers=settings.IMPORT_VALIDATION_WORKERS) as executor:
+        futures = [executor.submit(load_goods_chunk, text, line_offset, index_offset, category_ids)
+                   for line_offset, index_offset, text in chunks]
+        for future in futures:
+            chunk_goods, chunk_errors = future.result()
+            goods += chunk_goods
+            errors += chunk_errors
+    return goods, errors
+
+
+def find_duplicates(items, key, path):
+    errors, seen = [], {}
+    for number, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get(key), int):
+            continue
+        line = getattr(item, 'line', None)
+        if item[key] in seen:
+            errors.append(error(line, f'{path}[{number}].{key}',
+                                f'Повтор {key} {item[key]}, впервые в строке {seen[item[key]]}'))
+        else:
+            seen[item[key]] = line
+    return errors
+
+
+def validate_price_list(text, owner=None):
+    """
+        Разбор и полная проверка прайса до записи в базу, owner - контакт загружающего магазина.
+        Возвращает данные прайса и список ошибок с номерами строк; при ошибках данные не загружаются
+    """
+
+    chunk_size = settings.IMPORT_VALIDATION_CHUNK_SIZE
+    chunks = None
+    if settings.IMPORT_VALIDATION_WORKERS > 1 and text.count('\n') > chunk_size:
+        chunks = split_goods(text, chunk_size)
+    if chunks is not None:
+        text, chunks = chunks
+
+    try:
+        data = load_yaml(text)
+    except yaml.YAMLError as exc:
+        return None, [yaml_error(exc)]
+
+    errors = check_mapping(data, 1, 'root', ('shop', 'categories', 'goods'))
+    if errors:
+        return None, errors
+    errors += check_string(data['shop'], data.line, 'shop')
+    if owner is not None:
+        shop_name = Shop.objects.filter(owner=owner).exclude(name=data['shop']).values_list(
+            'name', flat=True).first()
+        if shop_name is not None:
+            errors.append(error(data.line, 'shop', f'У пользователя уже есть магазин "{shop_name}"'))
+
+    categories, goods = data['categories'], data['goods']
+    if not isinstance(categories, list):
+        errors.append(error(data.line, 'categories', 'Ожидается список категорий'))
+        categories = []
+    if not isinstance(goods, list):
+        errors.append(error(data.line, 'goods', 'Ожидается список товаров'))
+        goods = []
+
+    names = {}
+    for number, category in enumerate(categories):
+        path = f'categories[{number}]'
+        line = getattr(category, 'line', None)
+        category_errors = check_mapping(category, line, path, ('id', 'name'))
+        if not category_errors:
+            category_errors = check_integer(category['id'], line, f'{path}.id') + \
+                check_string(category['name'], line, f'{path}.name')
+        if not category_errors:
+            names[category['id']] = (category['name'], line, path)
+        errors += category_errors
+    errors += find_duplicates(categories, 'id', 'categories')
+
+    # Категория с тем же id, но другим названием уже есть в базе - get_or_create упадет на уникальности id
+    for category_id, name in Category.objects.filter(id__in=names).values_list('id', 'name'):
+        if names[category_id][0] != name:
+            _, line, path = names[category_id]
+            errors.append(error(line, f'{path}.name',
+                                f'Категория {category_id} уже существует с названием "{name}"'))
+
+    if chunks is None:
+        errors += validate_goods(goods, set(names))
+    else:
+        goods, goods_errors = load_goods_parallel(chunks, set(names))
+        data['goods'] = goods
+        errors += goods_errors
+    errors += find_duplicates(goods, 'id', 'goods')
+    errors.sort(key=lambda item: item['line'] or 0)
+    return data, errors
+
+
+def validate_price_list_file(file_name, owner=None):
+    """
+        Проверка прайса из файла, см. validate_price_list
+    """
+
+    try:
+        with open(file_name, 'r', encoding='UTF-8') as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as exc:
+        return None, [error(None, '', f'Не удалось прочитать файл: {exc}')]
+    return validate_price_list(text, owner)
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Перенос доставленных и отмененных заказов старше заданного срока в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='Возраст заказа в днях')
+        parser.add_argument('--batch-size', type=int, default=500, help='Заказов в одной транзакции')
+
+    def handle(self, *args, days, batch_size, **options):
+        archived = archive_orders(timezone.now() - timedelta(days=days), batch_size=batch_size)
+        self.stdout.write(f'Перенесено в архив заказов: {archived}')
@@ -0,0 +1,58 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from backend.models import ProductInfo, ProductParameter, Category, Shop
+from backend.offer_index import OfferIndex, sql_offers
+
+
+class Command(BaseCommand):
+    help = 'Сравнение задержки запросов каталога: индекс предложений в памяти и запрос в базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Количество случайных запросов')
+        parser.add_argument('--limit', type=int, default=20, help='Размер страницы')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора запросов')
+
+    def handle(self, *args, queries, limit, seed, **options):
+        if not ProductInfo.objects.exists():
+            self.stdout.write('Нет предложений для замера')
+            return
+
+        start = perf_counter()
+        index = OfferIndex()
+        index.build()
+        self.stdout.write(f'Индекс: {len(index.rows)} предложений, {len(index.codes)} значений характеристик, '
+                          f'построен за {perf_counter() - start:.2f} с')
+
+        rng = random.Random(seed)
+        categories = list(Category.objects.values_list('id', flat=True))
+        shops = list(Shop.objects.values_list('id', flat=True))
+        parameters = list(ProductParameter.objects.values_list('parameter__name', 'value').distinct()[:1000])
+        timings = {'индекс': [], 'база': []}
+        mismatches = 0
+        for _ in range(queries):
+            query = {
+                'category': rng.choice(categories) if categories and rng.random() < 0.8 else None,
+                'shop': rng.choice(shops) if shops and rng.random() < 0.3 else None,
+                'in_stock': rng.random() < 0.7,
+                'parameters': [rng.choice(parameters)] if parameters and rng.random() < 0.3 else [],
+                'ordering': rng.choice(['price', '-price', 'price_rrc']),
+                'limit': limit,
+                'offset': rng.choice([0, 0, limit, limit * 5]),
+            }
+            results = []
+            for name, run in (('индекс', index.query), ('база', sql_offers)):
+                start = perf_counter()
+                results.append(run(query))
+                timings[name].append(perf_counter() - start)
+            mismatches += results[0] != results[1]
+
+        for name, values in timings.items():
+            values.sort()
+            self.stdout.write(f'{name}: медиана {median(values) * 1000:.2f} мс, '
+                              f'p95 {values[int(len(values) * 0.95) - 1] * 1000:.2f} мс')
+        self.stdout.write(f'Ускорение по медиане x{median(timings["база"]) / median(timings["индекс"]):.1f}, '
+                          f'расхождений {mismatches}')
@@ -0,0 +1,56 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, F
+from rest_framework.renderers import JSONRenderer
+
+from backend.fast_serializers import product_info_data, order_detail_data
+from backend.models import ProductInfo, Order
+from backend.serializers import ProductInfoSerializer, OrderDetailSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение времени сериализации DRF и быстрого пути чтения (мс на 1000 строк)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Количество строк в выборке')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов замера')
+
+    def handle(self, *args, limit, repeat, **options):
+        renderer = JSONRenderer()
+
+        products = ProductInfo.objects.all().select_related('product__category', 'shop').prefetch_related(
+            'product_parameters__parameter').order_by('id')[:limit]
+        self.compare('ProductInfoSerializer', renderer, repeat,
+                     lambda: ProductInfoSerializer(products.all(), many=True).data,
+                     lambda: product_info_data(ProductInfo.objects.filter(
+                         id__in=list(products.values_list('id', flat=True))).order_by('id')))
+
+        orders = Order.objects.annotate(
+            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc'))).prefetch_related(
+            'order_items__product_info__product', 'order_items__shop').order_by('id')[:limit]
+        self.compare('OrderDetailSerializer', renderer, repeat,
+                     lambda: OrderDetailSerializer(orders.all(), many=True).data,
+                     lambda: order_detail_data(orders.all()))
+
+    def compare(self, name, renderer, repeat, slow, fast):
+        timings = []
+        for read in (slow, fast):
+            best, content = None, None
+            for _ in range(repeat):
+                start = perf_counter()
+                data = read()
+                elapsed = perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            content = renderer.render(data)
+            timings.append((best, len(data), content))
+
+        (slow_time, rows, slow_content), (fast_time, _, fast_content) = timings
+        if not rows:
+            self.stdout.write(f'{name}: нет данных для замера')
+            return
+        self.stdout.write(
+            f'{name}: {rows} строк, DRF {slow_time * 1000000 / rows:.1f} мс/1000 строк, '
+            f'быстрый путь {fast_time * 1000000 / rows:.1f} мс/1000 строк, '
+            f'ускорение x{slow_time / fast_time:.1f}, '
+            f'вывод {"совпадает" if slow_content == fast_content else "ОТЛИЧАЕТСЯ"}')
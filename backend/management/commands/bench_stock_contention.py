@@ -0,0 +1,77 @@
+import threading
+import time
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend.models import ProductInfo
+from backend.stock import enable_sharding, disable_sharding, reserve, available, stock_changes, InsufficientStock
+
+
+class Command(BaseCommand):
+    help = 'Оформлений в секунду для одного популярного предложения: одна строка остатка против слотов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_info_id', type=int, help='Предложение для замера, остаток восстанавливается')
+        parser.add_argument('--threads', type=int, default=16, help='Параллельных покупателей')
+        parser.add_argument('--checkouts', type=int, default=2000, help='Оформлений в каждом замере')
+        parser.add_argument('--slots', type=int, default=8, help='Число слотов')
+        parser.add_argument('--hold-ms', type=float, default=2,
+                            help='Сколько транзакция оформления держит блокировку после резерва, мс')
+
+    def handle(self, *args, product_info_id, threads, checkouts, slots, hold_ms, **options):
+        product_info = ProductInfo.objects.filter(pk=product_info_id).first()
+        if product_info is None:
+            raise CommandError(f'Предложение {product_info_id} не найдено')
+        if connection.vendor == 'sqlite':
+            # SQLite блокирует базу целиком, параллельные записи падают с "database is locked"
+            self.stdout.write('SQLite: замер в один поток, разница будет видна только на PostgreSQL')
+            threads = 1
+
+        original_slots = product_info.stock_slots.count()
+        original = available(product_info_id)
+        try:
+            for name, slot_count in (('одна строка', 0), (f'{slots} слотов', slots)):
+                disable_sharding(product_info_id)
+                ProductInfo.objects.filter(pk=product_info_id).update(quantity=checkouts)
+                if slot_count:
+                    enable_sharding(product_info_id, slot_count)
+                rate, failed = self.run(product_info_id, threads, checkouts, hold_ms / 1000)
+                stock_changes.flush()
+                left = available(product_info_id)
+                self.stdout.write(f'{name}: {rate:.0f} оформлений/с, отказов {failed}, остаток {left}')
+        finally:
+            disable_sharding(product_info_id)
+            ProductInfo.objects.filter(pk=product_info_id).update(quantity=original)
+            if original_slots:
+                enable_sharding(product_info_id, original_slots)
+
+    @staticmethod
+    def run(product_info_id, threads, checkouts, hold):
+        remaining = iter(range(checkouts))
+        lock = threading.Lock()
+        failed = []
+
+        def buyer():
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    try:
+                        with transaction.atomic():
+                            reserve(product_info_id, 1)
+                            time.sleep(hold)
+                    except InsufficientStock:
+                        failed.append(1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buyer) for _ in range(threads)]
+        start = perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return checkouts / (perf_counter() - start), len(failed)
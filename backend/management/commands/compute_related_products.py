@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from backend.recommendations import update_related_products
+
+
+class Command(BaseCommand):
+    help = 'Расчет товаров, которые часто покупают вместе, по подтвержденным заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать по всей истории заказов')
+
+    def handle(self, *args, full, **options):
+        run = update_related_products(full=full)
+        seconds = (run.finished_at - run.started_at).total_seconds()
+        self.stdout.write(f'Обработано строк заказов: {run.order_lines} за {seconds:.1f} с')
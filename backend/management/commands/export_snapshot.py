@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Выгрузка предложений с характеристиками и заказов (в том числе архивных) в Parquet или Arrow IPC '
+            'для аналитики')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Каталог выгрузок, по умолчанию settings.SNAPSHOT_DIR')
+        parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet', help='Формат файлов')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Только строки, измененные после прошлой выгрузки')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Строк на запрос к базе')
+
+    def handle(self, *args, dir, format, incremental, chunk_size, **options):
+        try:
+            from backend.snapshots import export_snapshot
+        except ImportError as exc:
+            raise CommandError(f'Для выгрузки нужен pyarrow (requirements.txt): {exc}')
+
+        snapshot = export_snapshot(dir or settings.SNAPSHOT_DIR, format, incremental, chunk_size)
+        kind = 'Инкрементная' if snapshot['incremental'] else 'Полная'
+        self.stdout.write(f'{kind} выгрузка {snapshot["path"]} за {snapshot["seconds"]} с')
+        for name, info in snapshot['files'].items():
+            self.stdout.write(f'  {info["path"]}: {info["rows"]} строк')
@@ -0,0 +1,32 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.provisioning import parse_accounts, provision_accounts
+
+
+class Command(BaseCommand):
+    help = 'Массовое создание пользователей с контактами из CSV (username, password, email, ..., type, phone, city)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_name', help='CSV с заголовком')
+        parser.add_argument('--workers', type=int, default=None, help='Процессов для хеширования паролей')
+        parser.add_argument('--no-email', action='store_true', help='Не отправлять письма о регистрации')
+
+    def handle(self, *args, file_name, workers, no_email, **options):
+        try:
+            with open(file_name, newline='', encoding='UTF-8') as f:
+                records = list(csv.DictReader(f))
+        except (OSError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f'Не удалось прочитать файл: {exc}')
+
+        accounts, errors = parse_accounts(records)
+        if errors:
+            for item in errors:
+                self.stderr.write(f'строка {item["row"]}, {item["field"]}: {item["error"]}')
+            raise CommandError(f'Ошибок в файле: {len(errors)}, пользователи не созданы')
+
+        report = provision_accounts(accounts, workers=workers, send_emails=not no_email)
+        self.stdout.write(f'Создано пользователей: {report["created"]} за {report["seconds"]} с '
+                          f'(хеширование {report["hashing_seconds"]} с, запись {report["insert_seconds"]} с), '
+                          f'{report["accounts_per_second"]} в секунду')
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.cleanup import purge_baskets
+
+
+class Command(BaseCommand):
+    help = 'Удаление брошенных корзин, которые не менялись дольше заданного срока'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Срок простоя корзины в днях')
+        parser.add_argument('--batch-size', type=int, default=500, help='Корзин в одной транзакции')
+        parser.add_argument('--pause', type=float, default=0.1, help='Пауза между пачками в секундах')
+
+    def handle(self, *args, days, batch_size, pause, **options):
+        start = perf_counter()
+        baskets, items = purge_baskets(timezone.now() - timedelta(days=days), batch_size=batch_size, pause=pause)
+        self.stdout.write(f'Удалено корзин: {baskets}, строк товаров: {items} за {perf_counter() - start:.1f} с')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Category, CategorySummary, ShopCategorySummary
+from backend.summaries import refresh_catalog_summaries
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет сводок по предложениям категорий и магазинов'
+
+    def handle(self, *args, **options):
+        refresh_catalog_summaries(Category.objects.values_list('id', flat=True))
+        self.stdout.write(f'Сводок категорий: {CategorySummary.objects.count()}, '
+                          f'сводок магазинов по категориям: {ShopCategorySummary.objects.count()}')
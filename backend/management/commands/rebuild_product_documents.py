@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.documents import refresh_product_documents
+from backend.models import ProductInfo, ProductDocument
+
+
+class Command(BaseCommand):
+    help = 'Пересборка документов всех предложений параллельными пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Предложений в одной транзакции')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков, у каждого свое соединение с базой')
+
+    def handle(self, *args, batch_size, workers, **options):
+        ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+        chunks = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+
+        def rebuild(chunk):
+            try:
+                refresh_product_documents(chunk, batch_size=batch_size)
+            finally:
+                connection.close()
+            return len(chunk)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for done, count in enumerate(executor.map(rebuild, chunks), start=1):
+                self.stdout.write(f'Пачка {done}/{len(chunks)}: {count} предложений')
+        self.stdout.write(f'Документов: {ProductDocument.objects.count()}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.analytics import rebuild_daily_sales
+from backend.models import DailySales
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет дневных продаж по подтвержденным заказам, включая архив (без данных о доставке)'
+
+    def handle(self, *args, **options):
+        rebuild_daily_sales()
+        self.stdout.write(f'Строк дневных продаж: {DailySales.objects.count()}')
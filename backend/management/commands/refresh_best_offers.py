@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Product
+from backend.offers import refresh_best_offers
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет лучших предложений по всем товарам'
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        refresh_best_offers(product_ids)
+        self.stdout.write(f'Лучшие предложения пересчитаны для {len(product_ids)} товаров')
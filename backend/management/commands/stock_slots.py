@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models import ProductInfo
+from backend.stock import enable_sharding, disable_sharding, rebalance_all, available
+
+
+class Command(BaseCommand):
+    help = 'Распределение остатка популярных предложений по слотам и выравнивание слотов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enable', type=int, metavar='PRODUCT_INFO_ID', help='Разбить остаток предложения')
+        parser.add_argument('--slots', type=int, default=8, help='Число слотов')
+        parser.add_argument('--disable', type=int, metavar='PRODUCT_INFO_ID', help='Собрать остаток обратно')
+        parser.add_argument('--rebalance', action='store_true', help='Выровнять слоты всех предложений')
+
+    def handle(self, *args, enable, slots, disable, rebalance, **options):
+        for product_info_id in filter(None, (enable, disable)):
+            if not ProductInfo.objects.filter(pk=product_info_id).exists():
+                raise CommandError(f'Предложение {product_info_id} не найдено')
+        if slots < 1:
+            raise CommandError('Число слотов должно быть положительным')
+
+        if enable:
+            enable_sharding(enable, slots)
+            self.stdout.write(f'Остаток предложения {enable} ({available(enable)}) разбит на {slots} слотов')
+        if disable:
+            disable_sharding(disable)
+            self.stdout.write(f'Остаток предложения {disable} ({available(disable)}) собран из слотов')
+        if rebalance:
+            self.stdout.write(f'Выровнены слоты предложений: {rebalance_all()}')
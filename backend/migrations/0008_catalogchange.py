@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_remove_orderitem_product_orderitem_product_info'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_info_id', models.BigIntegerField(verbose_name='Информация о продукте')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалено')),
+                ('dt', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_catalogchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'dt'], name='backend_ord_status_73e264_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['shop', 'order'], name='backend_ord_shop_id_89f05a_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_offers', to='backend.product', verbose_name='Продукт')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_offer_ranks', to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_offers', to='backend.shop', verbose_name='Магазин')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bestoffer',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='unique_best_offer_rank'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_bestoffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(verbose_name='Окончание')),
+                ('order_lines', models.PositiveBigIntegerField(verbose_name='Обработано строк заказов')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='confirmed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата подтверждения'),
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.PositiveIntegerField(verbose_name='Количество совместных заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_products', to='backend.product', verbose_name='Продукт')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.product', verbose_name='Связанный продукт')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='relatedproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='unique_related_product_rank'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('units', models.PositiveBigIntegerField(default=0, verbose_name='Продано штук')),
+                ('revenue', models.PositiveBigIntegerField(default=0, verbose_name='Выручка')),
+                ('delivered_units', models.PositiveBigIntegerField(default=0, verbose_name='Доставлено штук')),
+                ('delivered_revenue', models.PositiveBigIntegerField(default=0, verbose_name='Выручка по доставленным')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='backend.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='backend.product', verbose_name='Продукт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='backend.shop', verbose_name='Магазин')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('shop', 'day', 'category', 'product'), name='unique_daily_sales'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_archived_orders(apps, schema_editor):
+    """
+        На PostgreSQL пересоздает таблицу архива заказов как секционированную по месяцам поля dt.
+        Первичный ключ секционированной таблицы обязан включать ключ секционирования
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    table = apps.get_model('backend', 'ArchivedOrder')._meta.db_table
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute(f'ALTER TABLE {table} RENAME TO {table}_template')
+    schema_editor.execute('DROP INDEX archived_order_user_dt')
+    schema_editor.execute(f'CREATE TABLE {table} (LIKE {table}_template INCLUDING DEFAULTS) PARTITION BY RANGE (dt)')
+    schema_editor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, dt)')
+    schema_editor.execute(f'ALTER TABLE {table} ADD FOREIGN KEY (user_id) REFERENCES {user_table} (id) '
+                          f'DEFERRABLE INITIALLY DEFERRED')
+    schema_editor.execute(f'CREATE INDEX archived_order_user_dt ON {table} (user_id, dt)')
+    schema_editor.execute(f'DROP TABLE {table}_template')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_dailysales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('dt', models.DateTimeField()),
+                ('status', models.TextField(choices=[('OPEN', 'Статус корзины'), ('NEW', 'Новый'), ('CONFIRMED', 'Подтвержден'), ('ASSEMBLED', 'Собран'), ('SENT', 'Отправлен'), ('DELIVERED', 'Доставлен'), ('CANCELED', 'Отменен')], verbose_name='Статус')),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата подтверждения')),
+                ('total_sum', models.BigIntegerField(null=True, verbose_name='Сумма')),
+                ('items', models.JSONField(verbose_name='Товары')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'dt'], name='archived_order_user_dt')],
+            },
+        ),
+        migrations.RunPython(partition_archived_orders, migrations.RunPython.noop),
+    ]
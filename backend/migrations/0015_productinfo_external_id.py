@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Идентификатор у поставщика'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_shop_external_id'),
+        ),
+    ]
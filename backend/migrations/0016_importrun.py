@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_productinfo_external_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='Файл')),
+                ('status', models.CharField(choices=[('RUNNING', 'Выполняется'), ('DONE', 'Загружен'), ('INVALID', 'Ошибки в прайсе'), ('FAILED', 'Ошибка загрузки')], default='RUNNING', max_length=10, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начало')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Длительность, с')),
+                ('queries', models.PositiveIntegerField(default=0, verbose_name='Запросов к базе')),
+                ('stages', models.JSONField(default=dict, verbose_name='Стадии')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('profile', models.CharField(blank=True, max_length=255, verbose_name='Файл профиля')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_runs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-started_at'], name='import_run_user_started')],
+            },
+        ),
+    ]
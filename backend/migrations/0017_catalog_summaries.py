@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_importrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySummary',
+            fields=[
+                ('offers', models.PositiveIntegerField(default=0, verbose_name='Предложений')),
+                ('in_stock', models.PositiveIntegerField(default=0, verbose_name='Предложений в наличии')),
+                ('min_price_rrc', models.PositiveIntegerField(null=True, verbose_name='Минимальная цена')),
+                ('max_price_rrc', models.PositiveIntegerField(null=True, verbose_name='Максимальная цена')),
+                ('price_rrc_sum', models.PositiveBigIntegerField(default=0, verbose_name='Сумма цен')),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='backend.category', verbose_name='Категория')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopCategorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offers', models.PositiveIntegerField(default=0, verbose_name='Предложений')),
+                ('in_stock', models.PositiveIntegerField(default=0, verbose_name='Предложений в наличии')),
+                ('min_price_rrc', models.PositiveIntegerField(null=True, verbose_name='Минимальная цена')),
+                ('max_price_rrc', models.PositiveIntegerField(null=True, verbose_name='Максимальная цена')),
+                ('price_rrc_sum', models.PositiveBigIntegerField(default=0, verbose_name='Сумма цен')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_summaries', to='backend.category', verbose_name='Категория')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_summaries', to='backend.shop', verbose_name='Магазин')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shopcategorysummary',
+            constraint=models.UniqueConstraint(fields=('shop', 'category'), name='unique_shop_category_summary'),
+        ),
+    ]
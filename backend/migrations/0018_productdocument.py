@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_catalog_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocument',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('document', models.JSONField(verbose_name='Документ')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+        ),
+    ]
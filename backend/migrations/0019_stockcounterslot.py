@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_productdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCounterSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Слот')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_slots', to='backend.productinfo', verbose_name='Информация о продукте')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockcounterslot',
+            constraint=models.UniqueConstraint(fields=('product_info', 'slot'), name='unique_stock_counter_slot'),
+        ),
+    ]
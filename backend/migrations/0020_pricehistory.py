@@ -0,0 +1,60 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def partition_price_history(apps, schema_editor):
+    """
+        На PostgreSQL пересоздает таблицу истории цен как секционированную по месяцам поля month.
+        Первичный ключ и уникальность секционированной таблицы обязаны включать ключ секционирования,
+        id берется из обычной последовательности: IDENTITY у секционированных таблиц есть только с PostgreSQL 17
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    table = apps.get_model('backend', 'PriceHistory')._meta.db_table
+    product_info_table = apps.get_model('backend', 'ProductInfo')._meta.db_table
+    schema_editor.execute(f'ALTER TABLE {table} RENAME TO {table}_template')
+    schema_editor.execute(f'CREATE TABLE {table} (LIKE {table}_template INCLUDING DEFAULTS) PARTITION BY RANGE (month)')
+    schema_editor.execute(f'DROP TABLE {table}_template')
+    schema_editor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+    schema_editor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, month)')
+    schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT unique_price_history_month '
+                          f'UNIQUE (product_info_id, month)')
+    schema_editor.execute(f'ALTER TABLE {table} ADD FOREIGN KEY (product_info_id) REFERENCES {product_info_table} (id) '
+                          f'DEFERRABLE INITIALLY DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_stockcounterslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateTimeField(verbose_name='Месяц')),
+                ('started_at', models.DateTimeField(verbose_name='Время первой точки')),
+                ('base_price', models.PositiveIntegerField(verbose_name='Цена в первой точке')),
+                ('base_price_rrc', models.PositiveIntegerField(verbose_name='РРЦ в первой точке')),
+                ('base_quantity', models.PositiveIntegerField(verbose_name='Количество в первой точке')),
+                ('changed_at', models.DateTimeField(verbose_name='Время последней точки')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('points', models.PositiveIntegerField(default=1, verbose_name='Точек')),
+                ('changes', models.BinaryField(default=bytes, verbose_name='Изменения')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='backend.productinfo', verbose_name='Информация о продукте')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pricehistory',
+            constraint=models.UniqueConstraint(fields=('product_info', 'month'), name='unique_price_history_month'),
+        ),
+        migrations.RunPython(partition_price_history, migrations.RunPython.noop),
+    ]
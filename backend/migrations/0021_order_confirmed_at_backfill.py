@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import F
+
+
+CONFIRMED_STATUSES = ['CONFIRMED', 'ASSEMBLED', 'SENT', 'DELIVERED']
+
+
+def backfill_confirmed_at(apps, schema_editor):
+    """
+        Заказы, подтвержденные до появления confirmed_at, получают дату подтверждения по дате заказа,
+        иначе пересчет связанных товаров и продаж их не видит
+    """
+
+    for model_name in ('Order', 'ArchivedOrder'):
+        apps.get_model('backend', model_name).objects.filter(
+            confirmed_at__isnull=True, status__in=CONFIRMED_STATUSES).update(confirmed_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_pricehistory'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_confirmed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0021_order_confirmed_at_backfill'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['dt'], name='backend_ord_dt_9230ff_idx'),
+        ),
+    ]
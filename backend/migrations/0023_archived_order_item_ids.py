@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_item_ids(apps, schema_editor):
+    """
+        Позиции заказов, перенесенных в архив раньше, получают id товара, категории и магазина
+        по сохраненному id предложения, если предложение еще есть в базе
+    """
+
+    ArchivedOrder = apps.get_model('backend', 'ArchivedOrder')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    last_id = 0
+    while True:
+        orders = list(ArchivedOrder.objects.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'dt', 'items')[:BATCH_SIZE])
+        if not orders:
+            return
+        last_id = orders[-1][0]
+
+        product_info_ids = {(item.get('product_info') or {}).get('id') for _, _, items in orders for item in items}
+        offers = {pk: (product_id, category_id, shop_id) for pk, product_id, category_id, shop_id in
+                  ProductInfo.objects.filter(id__in=product_info_ids - {None}).values_list(
+                      'id', 'product_id', 'product__category_id', 'shop_id')}
+        for order_id, dt, items in orders:
+            changed = False
+            for item in items:
+                product_info = item.get('product_info') or {}
+                product = product_info.get('product') or {}
+                if product_info.get('id') not in offers or 'id' in product:
+                    continue
+                product_id, category_id, shop_id = offers[product_info['id']]
+                product_info['product'] = {'id': product_id, **product, 'category': category_id}
+                item['shop'] = {'id': shop_id, **(item.get('shop') or {})}
+                changed = True
+            if changed:
+                ArchivedOrder.objects.filter(id=order_id, dt=dt).update(items=items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_order_dt_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_item_ids, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 from django.db.models import Sum
 
@@ -16,6 +16,24 @@ class OrderStatusChoices(models.TextChoices):
     CANCELED = 'CANCELED', 'Отменен'
 
 
+# Переходы статусов заказа, которые выполняет магазин
+SHOP_ORDER_TRANSITIONS = {
+    OrderStatusChoices.CONFIRMED: OrderStatusChoices.ASSEMBLED,
+    OrderStatusChoices.ASSEMBLED: OrderStatusChoices.SENT,
+    OrderStatusChoices.SENT: OrderStatusChoices.DELIVERED,
+}
+
+
+class ImportStatusChoices(models.TextChoices):
+    """
+        Статусы загрузки прайса
+    """
+    RUNNING = 'RUNNING', 'Выполняется'
+    DONE = 'DONE', 'Загружен'
+    INVALID = 'INVALID', 'Ошибки в прайсе'
+    FAILED = 'FAILED', 'Ошибка загрузки'
+
+
 class UserTypeChoices(models.TextChoices):
     """
         Типы пользователей
@@ -87,6 +105,30 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество', default=1)
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    external_id = models.PositiveIntegerField(verbose_name='Идентификатор у поставщика', null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_shop_external_id'),
+        ]
+
+
+class BestOffer(models.Model):
+    """
+        Лучшие предложения товара в наличии: rank 1 - самое дешевое, далее альтернативы
+    """
+    product = models.ForeignKey(Product, related_name='best_offers', verbose_name='Продукт', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    product_info = models.ForeignKey(ProductInfo, related_name='best_offer_ranks',
+                                     verbose_name='Информация о продукте', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, related_name='best_offers', verbose_name='Магазин', on_delete=models.CASCADE)
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_best_offer_rank'),
+        ]
 
 
 class Parameter(models.Model):
@@ -118,6 +160,16 @@ class Order(models.Model):
     dt = models.DateTimeField(auto_now_add=True)
     status = models.TextField(choices=OrderStatusChoices.choices, verbose_name='Статус',
                               default=OrderStatusChoices.BASKET)
+    confirmed_at = models.DateTimeField(verbose_name='Дата подтверждения', null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения', auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'dt']),
+            models.Index(fields=['status', 'updated_at']),
+            # Фильтр админки по дате заказа без статуса
+            models.Index(fields=['dt']),
+        ]
 
     def __str__(self):
         return str(f'Заказ No{self.pk} от {self.dt} для {self.user}')
@@ -131,3 +183,227 @@ class OrderItem(models.Model):
     product_info = models.ForeignKey(ProductInfo, related_name='order_items', on_delete=models.CASCADE, null=True)
     shop = models.ForeignKey(Shop, related_name='order_items', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'order']),
+        ]
+
+
+# Ключ транзакционной блокировки PostgreSQL, под которой пишется журнал изменений каталога
+CATALOG_CHANGE_LOCK = 0x636174616c6f67
+
+
+class CatalogChange(models.Model):
+    """
+        Журнал изменений каталога. Идентификатор записи служит ревизией каталога
+    """
+    product_info_id = models.BigIntegerField(verbose_name='Информация о продукте')
+    deleted = models.BooleanField(verbose_name='Удалено', default=False)
+    dt = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, upserted, deleted=()):
+        """
+            Записывает изменения предложений в журнал. Транзакции пишут журнал по очереди: блокировка
+            держится до фиксации, поэтому id записей фиксируются в порядке возрастания. В SQLite
+            пишущая транзакция и так одна
+        """
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CATALOG_CHANGE_LOCK])
+            cls.objects.bulk_create(
+                [cls(product_info_id=pk, deleted=False) for pk in sorted(upserted)] +
+                [cls(product_info_id=pk, deleted=True) for pk in sorted(deleted)], batch_size=1000)
+
+    @classmethod
+    def current_revision(cls):
+        """
+            Текущая ревизия каталога. Журнал фиксируется в порядке id (record), поэтому все записи
+            до видимого максимального id уже зафиксированы и чтение changes?since= ничего не пропускает
+        """
+        return cls.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+class RelatedProduct(models.Model):
+    """
+        Товары, которые часто покупают вместе с товаром
+    """
+    product = models.ForeignKey(Product, related_name='related_products', verbose_name='Продукт',
+                                on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    related = models.ForeignKey(Product, related_name='+', verbose_name='Связанный продукт', on_delete=models.CASCADE)
+    score = models.PositiveIntegerField(verbose_name='Количество совместных заказов')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_product_rank'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """
+        Запуск расчета связанных товаров. Следующий запуск учитывает заказы, подтвержденные после started_at
+    """
+    started_at = models.DateTimeField(verbose_name='Начало')
+    finished_at = models.DateTimeField(verbose_name='Окончание')
+    order_lines = models.PositiveBigIntegerField(verbose_name='Обработано строк заказов')
+
+
+class StockCounterSlot(models.Model):
+    """
+        Часть остатка популярного предложения. Остаток такого предложения - сумма по слотам,
+        резерв при оформлении заказа берется из случайного слота, чтобы покупатели не ждали блокировку одной строки
+    """
+    product_info = models.ForeignKey(ProductInfo, related_name='stock_slots', verbose_name='Информация о продукте',
+                                     on_delete=models.CASCADE)
+    slot = models.PositiveSmallIntegerField(verbose_name='Слот')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'slot'], name='unique_stock_counter_slot'),
+        ]
+
+
+class PriceHistory(models.Model):
+    """
+        Цена, РРЦ и остаток предложения за месяц. Первая точка месяца хранится целиком (base_*), следующие
+        дописываются в changes разностями с предыдущей точкой (см. backend.price_history), последняя точка
+        повторена в price, price_rrc и quantity. На PostgreSQL таблица секционирована по месяцам поля month
+    """
+    product_info = models.ForeignKey(ProductInfo, related_name='price_history', verbose_name='Информация о продукте',
+                                     on_delete=models.CASCADE)
+    month = models.DateTimeField(verbose_name='Месяц')
+    started_at = models.DateTimeField(verbose_name='Время первой точки')
+    base_price = models.PositiveIntegerField(verbose_name='Цена в первой точке')
+    base_price_rrc = models.PositiveIntegerField(verbose_name='РРЦ в первой точке')
+    base_quantity = models.PositiveIntegerField(verbose_name='Количество в первой точке')
+    changed_at = models.DateTimeField(verbose_name='Время последней точки')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    points = models.PositiveIntegerField(default=1, verbose_name='Точек')
+    changes = models.BinaryField(default=bytes, verbose_name='Изменения')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'month'], name='unique_price_history_month'),
+        ]
+
+
+class ProductDocument(models.Model):
+    """
+        Предложение целиком в одном документе (формат ProductInfoSerializer): товар, категория,
+        магазин и характеристики. Пересчитывается при изменении любой из исходных строк
+    """
+    product_info = models.OneToOneField(ProductInfo, related_name='document', verbose_name='Информация о продукте',
+                                        primary_key=True, on_delete=models.CASCADE)
+    document = models.JSONField(verbose_name='Документ')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+
+class OfferSummary(models.Model):
+    """
+        Число предложений и диапазон рекомендуемых цен, обновляются при изменении предложений
+    """
+    offers = models.PositiveIntegerField(default=0, verbose_name='Предложений')
+    in_stock = models.PositiveIntegerField(default=0, verbose_name='Предложений в наличии')
+    min_price_rrc = models.PositiveIntegerField(null=True, verbose_name='Минимальная цена')
+    max_price_rrc = models.PositiveIntegerField(null=True, verbose_name='Максимальная цена')
+    price_rrc_sum = models.PositiveBigIntegerField(default=0, verbose_name='Сумма цен')
+
+    class Meta:
+        abstract = True
+
+    @property
+    def avg_price_rrc(self):
+        return round(self.price_rrc_sum / self.offers, 2) if self.offers else None
+
+
+class CategorySummary(OfferSummary):
+    """
+        Сводка по предложениям категории
+    """
+    category = models.OneToOneField(Category, related_name='summary', verbose_name='Категория', primary_key=True,
+                                    on_delete=models.CASCADE)
+
+
+class ShopCategorySummary(OfferSummary):
+    """
+        Сводка по предложениям магазина в категории
+    """
+    shop = models.ForeignKey(Shop, related_name='category_summaries', verbose_name='Магазин',
+                             on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='shop_summaries', verbose_name='Категория',
+                                 on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category'], name='unique_shop_category_summary'),
+        ]
+
+
+class ImportRun(models.Model):
+    """
+        Загрузка прайса: время, число запросов к базе и обработанных строк по стадиям
+    """
+    user = models.ForeignKey(User, related_name='import_runs', verbose_name='Пользователь', null=True,
+                             on_delete=models.SET_NULL)
+    file_name = models.CharField(max_length=255, verbose_name='Файл')
+    status = models.CharField(max_length=10, choices=ImportStatusChoices.choices,
+                              default=ImportStatusChoices.RUNNING, verbose_name='Статус')
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='Начало')
+    duration = models.FloatField(null=True, blank=True, verbose_name='Длительность, с')
+    queries = models.PositiveIntegerField(default=0, verbose_name='Запросов к базе')
+    stages = models.JSONField(default=dict, verbose_name='Стадии')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    profile = models.CharField(max_length=255, blank=True, verbose_name='Файл профиля')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-started_at'], name='import_run_user_started'),
+        ]
+
+
+class DailySales(models.Model):
+    """
+        Продажи магазина по товару за день: подтвержденные и доставленные заказы
+    """
+    shop = models.ForeignKey(Shop, related_name='daily_sales', verbose_name='Магазин', on_delete=models.CASCADE)
+    day = models.DateField(verbose_name='День')
+    category = models.ForeignKey(Category, related_name='daily_sales', verbose_name='Категория',
+                                 on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='daily_sales', verbose_name='Продукт', on_delete=models.CASCADE)
+    units = models.PositiveBigIntegerField(verbose_name='Продано штук', default=0)
+    revenue = models.PositiveBigIntegerField(verbose_name='Выручка', default=0)
+    delivered_units = models.PositiveBigIntegerField(verbose_name='Доставлено штук', default=0)
+    delivered_revenue = models.PositiveBigIntegerField(verbose_name='Выручка по доставленным', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'day', 'category', 'product'], name='unique_daily_sales'),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+        Завершенный заказ, перенесенный из Order в архив. Идентификатор совпадает с исходным заказом,
+        товары хранятся в items в том же виде, в каком их отдает API заказов, и с id товара, категории и магазина.
+        На PostgreSQL таблица секционирована по месяцам поля dt
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='archived_orders', verbose_name='Пользователь',
+                             on_delete=models.CASCADE)
+    dt = models.DateTimeField()
+    status = models.TextField(choices=OrderStatusChoices.choices, verbose_name='Статус')
+    confirmed_at = models.DateTimeField(verbose_name='Дата подтверждения', null=True, blank=True)
+    total_sum = models.BigIntegerField(verbose_name='Сумма', null=True)
+    items = models.JSONField(verbose_name='Товары')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'dt'], name='archived_order_user_dt'),
+        ]
@@ -0,0 +1,243 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from backend.models import ProductInfo, ProductParameter, CatalogChange
+
+
+# Сортировки каталога: параметр ordering -> поле предложения
+ORDERINGS = {
+    'id': 'id',
+    'price': 'price',
+    'price_rrc': 'price_rrc',
+    'quantity': 'quantity',
+}
+
+# Параметры запроса каталога; запросы с другими параметрами идут через фильтры ProductViewSet
+QUERY_PARAMS = {'category', 'shop', 'in_stock', 'parameter', 'ordering', 'limit', 'offset'}
+QUERY_TRIGGERS = {'category', 'in_stock', 'parameter', 'limit', 'offset'}
+
+MAX_LIMIT = 1000
+
+# Если изменилось больше предложений, индекс строится заново, а не обновляется по одному
+REBUILD_THRESHOLD = 5000
+
+
+def catalog_query_requested(params):
+    """
+        Запрос к /products/ выражается через category, shop, in_stock, parameter, ordering, limit, offset;
+        fields и expand выбирают только поля ответа
+    """
+    keys = set(params) - {'format', 'fields', 'expand'}
+    return keys <= QUERY_PARAMS and bool(keys & QUERY_TRIGGERS)
+
+
+def parse_offer_query(params):
+    """
+        Разбор параметров запроса каталога, ValueError при ошибке. parameter=Название:значение
+        можно повторять, ordering - поле из ORDERINGS, с минусом - по убыванию
+    """
+
+    ordering = params.get('ordering') or 'id'
+    if ordering.lstrip('-') not in ORDERINGS:
+        raise ValueError(f'ordering: {", ".join(ORDERINGS)}')
+
+    parameters = []
+    for item in params.getlist('parameter'):
+        name, separator, value = item.partition(':')
+        if not separator or not name.strip():
+            raise ValueError('parameter ожидается в виде Название:значение')
+        parameters.append((name.strip(), value.strip()))
+
+    limit = int(params['limit']) if params.get('limit') else None
+    offset = int(params.get('offset') or 0)
+    if limit is not None and not 0 < limit <= MAX_LIMIT or offset < 0:
+        raise ValueError(f'limit от 1 до {MAX_LIMIT}, offset неотрицательный')
+
+    return {
+        'category': int(params['category']) if params.get('category') else None,
+        'shop': int(params['shop']) if params.get('shop') else None,
+        'in_stock': params.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+        'parameters': parameters,
+        'ordering': ordering,
+        'limit': limit,
+        'offset': offset,
+    }
+
+
+def sql_offers(query):
+    """ Число предложений и id страницы запроса каталога из базы """
+
+    queryset = ProductInfo.objects.all()
+    if query['category'] is not None:
+        queryset = queryset.filter(product__category_id=query['category'])
+    if query['shop'] is not None:
+        queryset = queryset.filter(shop_id=query['shop'])
+    if query['in_stock']:
+        queryset = queryset.filter(quantity__gt=0)
+    for name, value in query['parameters']:
+        queryset = queryset.filter(product_parameters__parameter__name=name, product_parameters__value=value)
+
+    field = ORDERINGS[query['ordering'].lstrip('-')]
+    descending = query['ordering'].startswith('-')
+    queryset = queryset.order_by(f'-{field}' if descending else field, 'id')
+    ids = queryset.values_list('id', flat=True)
+    end = None if query['limit'] is None else query['offset'] + query['limit']
+    return queryset.count(), list(ids[query['offset']:end])
+
+
+class OfferIndex:
+    """
+        Предложения в массивах NumPy внутри процесса: категория, магазин, цены, остаток и коды
+        характеристик (Название, значение). Фильтры - векторные маски, сортировка - argsort по
+        отобранным строкам. Измененные предложения дописываются в конец массивов, старые строки
+        помечаются удаленными; индекс строится заново, когда удаленных строк становится много
+    """
+
+    def __init__(self):
+        self.revision = None
+        self.synced_at = 0
+        self.rows = {}
+        self.codes = {}
+        self.arrays = {}
+        self.param_codes = np.empty(0, dtype=np.int32)
+        self.param_rows = np.empty(0, dtype=np.int32)
+        self.alive = np.empty(0, dtype=bool)
+        self._lock = threading.RLock()
+
+    @property
+    def built(self):
+        return self.revision is not None
+
+    @staticmethod
+    def load(product_info_ids=None):
+        offers = ProductInfo.objects.order_by('id')
+        parameters = ProductParameter.objects.order_by('id')
+        if product_info_ids is not None:
+            offers = offers.filter(id__in=product_info_ids)
+            parameters = parameters.filter(product_info_id__in=product_info_ids)
+        rows = list(offers.values_list('id', 'product__category_id', 'shop_id', 'price', 'price_rrc', 'quantity'))
+        return rows, list(parameters.values_list('product_info_id', 'parameter__name', 'value'))
+
+    @staticmethod
+    def columns(rows):
+        columns = list(zip(*rows)) or [()] * 6
+        return {
+            'id': np.array(columns[0], dtype=np.int64),
+            'category': np.array(columns[1], dtype=np.int64),
+            'shop': np.array(columns[2], dtype=np.int64),
+            'price': np.array(columns[3], dtype=np.int64),
+            'price_rrc': np.array(columns[4], dtype=np.int64),
+            'quantity': np.array(columns[5], dtype=np.int64),
+        }
+
+    def encode(self, parameters, rows):
+        """ Строки массива и коды характеристик загруженных предложений """
+        return (np.array([rows[product_info_id] for product_info_id, _, _ in parameters], dtype=np.int32),
+                np.array([self.codes.setdefault((name, value), len(self.codes)) for _, name, value in parameters],
+                         dtype=np.int32))
+
+    def set_parameters(self, rows, codes):
+        # Строки отсортированы по коду характеристики: строки одного кода ищутся через searchsorted
+        order = np.argsort(codes, kind='stable')
+        self.param_rows, self.param_codes = rows[order], codes[order]
+
+    def build(self):
+        revision = CatalogChange.current_revision()
+        offers, parameters = self.load()
+
+        with self._lock:
+            self.arrays = self.columns(offers)
+            self.rows = {product_info_id: row for row, (product_info_id, *_) in enumerate(offers)}
+            self.alive = np.ones(len(offers), dtype=bool)
+            self.codes = {}
+            self.set_parameters(*self.encode(parameters, self.rows))
+            self.revision = revision
+            self.synced_at = time.monotonic()
+
+    def update_offers(self, product_info_ids):
+        """ Перечитывает предложения из базы, удаленные убирает из индекса """
+
+        product_info_ids = set(product_info_ids)
+        if not self.built or not product_info_ids:
+            return
+        if len(product_info_ids) > REBUILD_THRESHOLD:
+            self.build()
+            return
+
+        offers, parameters = self.load(product_info_ids)
+        with self._lock:
+            for product_info_id in product_info_ids:
+                row = self.rows.pop(product_info_id, None)
+                if row is not None:
+                    self.alive[row] = False
+            if self.alive.size and np.count_nonzero(~self.alive) > self.alive.size // 4:
+                self.build()
+                return
+
+            start = len(self.alive)
+            new_rows = {product_info_id: start + number for number, (product_info_id, *_) in enumerate(offers)}
+            columns = self.columns(offers)
+            self.arrays = {name: np.concatenate([self.arrays[name], columns[name]]) for name in self.arrays}
+            self.alive = np.concatenate([self.alive, np.ones(len(offers), dtype=bool)])
+            self.rows.update(new_rows)
+            rows, codes = self.encode(parameters, new_rows)
+            self.set_parameters(np.concatenate([self.param_rows, rows]), np.concatenate([self.param_codes, codes]))
+
+    def sync(self):
+        """
+            Строит индекс или применяет изменения каталога, сделанные после построения, в том числе другими процессами
+        """
+
+        if not self.built:
+            self.build()
+            return
+        if time.monotonic() - self.synced_at < settings.OFFER_INDEX_SYNC_INTERVAL:
+            return
+
+        revision = CatalogChange.current_revision()
+        if revision != self.revision:
+            self.update_offers(CatalogChange.objects.filter(id__gt=self.revision, id__lte=revision).values_list(
+                'product_info_id', flat=True))
+            self.revision = revision
+        self.synced_at = time.monotonic()
+
+    def query(self, query):
+        """ Число предложений и id страницы запроса каталога, как sql_offers """
+
+        with self._lock:
+            arrays = self.arrays
+            mask = self.alive.copy()
+            if query['category'] is not None:
+                mask &= arrays['category'] == query['category']
+            if query['shop'] is not None:
+                mask &= arrays['shop'] == query['shop']
+            if query['in_stock']:
+                mask &= arrays['quantity'] > 0
+            for parameter in query['parameters']:
+                code = self.codes.get(parameter)
+                matched = np.zeros_like(mask)
+                if code is not None:
+                    matched[self.param_rows[np.searchsorted(self.param_codes, code, 'left'):
+                                            np.searchsorted(self.param_codes, code, 'right')]] = True
+                mask &= matched
+
+            rows = np.flatnonzero(mask)
+            total = rows.size
+            field = ORDERINGS[query['ordering'].lstrip('-')]
+            keys = arrays[field][rows]
+            if query['ordering'].startswith('-'):
+                keys = -keys
+
+            end = total if query['limit'] is None else min(query['offset'] + query['limit'], total)
+            if 0 < end < total:
+                # Нужны только первые end строк: отбираются все строки не дальше end-го значения (с равными)
+                selected = keys <= np.partition(keys, end - 1)[end - 1]
+                rows, keys = rows[selected], keys[selected]
+            order = np.lexsort((arrays['id'][rows], keys))
+            return total, arrays['id'][rows[order[query['offset']:end]]].tolist()
+
+
+offer_index = OfferIndex()
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from backend.models import ProductInfo, BestOffer
+
+
+# Сколько лучших предложений хранится для каждого товара
+BEST_OFFERS_LIMIT = 5
+
+BATCH_SIZE = 1000
+
+
+def refresh_best_offers(product_ids):
+    """
+        Пересчет лучших предложений для указанных товаров. Места перезаписываются upsert по (product, rank),
+        затем удаляются места сверх нового числа предложений: параллельные пересчеты одного товара
+        не нарушают уникальность места, как при удалении и повторной вставке
+    """
+
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        offers = ProductInfo.objects.filter(
+            product_id__in=batch, quantity__gt=0, shop__state=True).annotate(
+            rank=Window(RowNumber(), partition_by=[F('product_id')], order_by=[F('price_rrc').asc(), F('id').asc()])
+        ).filter(rank__lte=BEST_OFFERS_LIMIT).values_list('product_id', 'rank', 'id', 'shop_id', 'price_rrc', 'quantity')
+
+        best_offers = sorted((BestOffer(product_id=product_id, rank=rank, product_info_id=product_info_id,
+                                        shop_id=shop_id, price_rrc=price_rrc, quantity=quantity)
+                              for product_id, rank, product_info_id, shop_id, price_rrc, quantity in offers),
+                             key=lambda offer: (offer.product_id, offer.rank))
+        counts = dict.fromkeys(batch, 0)
+        for offer in best_offers:
+            counts[offer.product_id] = offer.rank
+        by_count = {}
+        for product_id, count in counts.items():
+            by_count.setdefault(count, []).append(product_id)
+
+        with transaction.atomic():
+            BestOffer.objects.bulk_create(best_offers, update_conflicts=True, unique_fields=['product', 'rank'],
+                                          update_fields=['product_info', 'shop', 'price_rrc', 'quantity'])
+            for count, products in by_count.items():
+                BestOffer.objects.filter(product_id__in=products, rank__gt=count).delete()
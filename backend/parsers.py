@@ -0,0 +1,19 @@
+import csv
+import io
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """
+        Разбор CSV с заголовком в список словарей
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        try:
+            return list(csv.DictReader(io.StringIO(stream.read().decode(encoding))))
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise ParseError(f'Ошибка разбора CSV: {error}')
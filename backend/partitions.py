@@ -0,0 +1,27 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection
+
+
+def month_bounds(value):
+    """ Начало месяца и начало следующего месяца (UTC) """
+    start = datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+    end = datetime(value.year + value.month // 12, value.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def ensure_month_partition(model, value):
+    """
+        Создает на PostgreSQL месячную секцию таблицы модели для даты value, если ее еще нет.
+        На других СУБД таблицы не секционируются
+    """
+
+    if connection.vendor != 'postgresql':
+        return
+
+    start, end = month_bounds(value)
+    table = model._meta.db_table
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {qn(f"{table}_y{start:%Y}m{start:%m}")} '
+                       f'PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)', [start, end])
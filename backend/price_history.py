@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import ProductInfo, PriceHistory
+from backend.partitions import ensure_month_partition, month_bounds
+
+
+# Шаг прореживания истории: название -> секунды
+RESOLUTIONS = {
+    'minute': 60,
+    'hour': 60 * 60,
+    'day': 60 * 60 * 24,
+    'week': 60 * 60 * 24 * 7,
+}
+
+# Больше интервалов за один запрос не отдается, нужен более крупный шаг или короткий период
+MAX_HISTORY_POINTS = 2000
+
+FIELDS = ('price', 'price_rrc', 'quantity')
+
+
+def pack(numbers, buffer):
+    """ Целые числа со знаком в varint (zigzag): небольшие разности занимают 1-2 байта """
+    for number in numbers:
+        number = number << 1 if number >= 0 else (-number << 1) - 1
+        while number > 0x7f:
+            buffer.append(number & 0x7f | 0x80)
+            number >>= 7
+        buffer.append(number)
+
+
+def unpack(data):
+    number = shift = 0
+    for byte in data:
+        number |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            yield number >> 1 if not number & 1 else -((number + 1) >> 1)
+            number = shift = 0
+
+
+def segment_points(segment):
+    """
+        Точки месячного отрезка: (время, цена, РРЦ, количество). Каждая следующая точка в changes -
+        секунды с предыдущей и разности значений
+    """
+
+    at, values = segment.started_at, [segment.base_price, segment.base_price_rrc, segment.base_quantity]
+    yield at, *values
+    numbers = unpack(bytes(segment.changes))
+    for seconds in numbers:
+        at += timedelta(seconds=seconds)
+        values = [value + next(numbers) for value in values]
+        yield at, *values
+
+
+def record_price_changes(product_info_ids, at=None):
+    """
+        Дописывает в историю цену, РРЦ и остаток предложений, если они изменились с последней точки.
+        Возвращает число записанных точек
+    """
+
+    product_info_ids = set(product_info_ids)
+    if not product_info_ids:
+        return 0
+    # Время точек хранится с точностью до секунды, чтобы разности времени в changes были точными
+    at = (at or timezone.now()).replace(microsecond=0)
+    month, _ = month_bounds(at)
+    current = {product_info_id: values for product_info_id, *values in ProductInfo.objects.filter(
+        id__in=product_info_ids).values_list('id', *FIELDS)}
+
+    with transaction.atomic():
+        segments = {segment.product_info_id: segment for segment in PriceHistory.objects.select_for_update().filter(
+            product_info_id__in=current, month=month)}
+
+        # Последние значения прошлых месяцев, чтобы первая точка месяца тоже писалась только при изменении
+        previous = {}
+        for product_info_id, *values in PriceHistory.objects.filter(
+                product_info_id__in=set(current) - set(segments), month__lt=month).order_by(
+                'product_info_id', '-month').values_list('product_info_id', *FIELDS):
+            previous.setdefault(product_info_id, values)
+
+        created, updated = [], []
+        for product_info_id, values in current.items():
+            segment = segments.get(product_info_id)
+            if segment is None:
+                if previous.get(product_info_id) == values:
+                    continue
+                created.append(PriceHistory(
+                    product_info_id=product_info_id, month=month, started_at=at, changed_at=at,
+                    **dict(zip(FIELDS, values)), **{f'base_{name}': value for name, value in zip(FIELDS, values)}))
+                continue
+
+            last = [getattr(segment, name) for name in FIELDS]
+            if last == values:
+                continue
+            changes = bytearray(segment.changes)
+            pack([max(int((at - segment.changed_at).total_seconds()), 0),
+                  *(value - old for value, old in zip(values, last))], changes)
+            segment.changes = bytes(changes)
+            segment.changed_at = at
+            segment.points += 1
+            for name, value in zip(FIELDS, values):
+                setattr(segment, name, value)
+            updated.append(segment)
+
+        if created:
+            ensure_month_partition(PriceHistory, month)
+            PriceHistory.objects.bulk_create(created, batch_size=1000)
+        PriceHistory.objects.bulk_update(updated, ['changes', 'changed_at', 'points', *FIELDS], batch_size=1000)
+    return len(created) + len(updated)
+
+
+def price_history(product_info_id, start, end, resolution):
+    """
+        История предложения за [start, end), прореженная до интервалов по resolution секунд.
+        Для интервала с изменениями - цена на его конец, минимум и максимум цены внутри, РРЦ и остаток
+        на конец; интервалы без изменений пропускаются. Первый интервал начинается значениями на момент start
+    """
+
+    step = timedelta(seconds=resolution)
+    segments = PriceHistory.objects.filter(product_info_id=product_info_id, month__gte=month_bounds(start)[0],
+                                           month__lt=end).order_by('month')
+    state = PriceHistory.objects.filter(product_info_id=product_info_id, month__lt=month_bounds(start)[0]).order_by(
+        '-month').values_list(*FIELDS).first()
+
+    buckets, bucket = [], None
+
+    def open_bucket(bucket_start, price, price_rrc, quantity):
+        return {'dt': bucket_start, 'price': price, 'price_min': price, 'price_max': price,
+                'price_rrc': price_rrc, 'quantity': quantity}
+
+    for segment in segments:
+        for at, *values in segment_points(segment):
+            if at >= end:
+                break
+            if at >= start:
+                bucket_start = start + step * ((at - start) // step)
+                if bucket is None or bucket['dt'] != bucket_start:
+                    if bucket is None and state is not None and bucket_start != start:
+                        buckets.append(open_bucket(start, *state))
+                    # Интервал начинается с цены, действовавшей до первого изменения в нем
+                    bucket = open_bucket(bucket_start, *(state or values))
+                    buckets.append(bucket)
+                price, bucket['price_rrc'], bucket['quantity'] = values
+                bucket['price'] = price
+                bucket['price_min'] = min(bucket['price_min'], price)
+                bucket['price_max'] = max(bucket['price_max'], price)
+            state = values
+
+    if not buckets and state is not None:
+        buckets.append(open_bucket(start, *state))
+    return buckets
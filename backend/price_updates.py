@@ -0,0 +1,91 @@
+from django.db import connection, transaction
+
+from backend.models import ProductInfo
+from backend.signals import notify_offers_changed_later
+from backend.stock import distribute_stock
+
+
+FIELDS = ('external_id', 'price', 'price_rrc', 'quantity')
+
+BATCH_SIZE = 5000
+
+# Больше ошибок в ответе не показывается
+MAX_ERRORS = 100
+
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def parse_price_updates(records):
+    """
+        Проверка записей обновления цен. external_id обязателен, остальные поля - неотрицательные целые
+        или отсутствуют (не меняются). Возвращает словарь external_id -> (price, price_rrc, quantity)
+        и список ошибок с номерами записей, при повторе external_id действует последняя запись
+    """
+
+    updates, errors = {}, []
+    for number, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            errors.append({'row': number, 'error': 'Ожидается объект с полями ' + ', '.join(FIELDS)})
+            continue
+
+        values = []
+        for field in FIELDS:
+            value = record.get(field)
+            if value in (None, ''):
+                values.append(None)
+                continue
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = -1
+            if not 0 <= value <= MAX_INTEGER:
+                errors.append({'row': number, 'error': f'{field}: ожидается неотрицательное целое число'})
+                break
+            values.append(value)
+        else:
+            if values[0] is None:
+                errors.append({'row': number, 'error': 'external_id: обязательное поле'})
+            else:
+                updates[values[0]] = tuple(values[1:])
+
+        if len(errors) >= MAX_ERRORS:
+            break
+    return updates, errors
+
+
+def apply_price_updates(shop, updates):
+    """
+        Обновляет цены и остатки предложений магазина одним UPDATE ... FROM (VALUES ...) на пачку.
+        updates - результат parse_price_updates. Возвращает id обновленных предложений и неизвестные external_id.
+        Журнал каталога и документы пишутся в той же транзакции, обработчики offers_changed - после фиксации, в фоне
+    """
+
+    qn = connection.ops.quote_name
+    table = qn(ProductInfo._meta.db_table)
+    # Колонки VALUES названы иначе, чем колонки таблицы, чтобы в RETURNING не было неоднозначности
+    columns = [qn(f'new_{name}') for name in FIELDS]
+    sets = ', '.join(f'{qn(name)} = COALESCE(v.{column}, t.{qn(name)})'
+                     for name, column in zip(FIELDS[1:], columns[1:]))
+    placeholder = f'({", ".join(["CAST(%s AS integer)"] * len(FIELDS))})'
+    batch_size = min(BATCH_SIZE, (connection.features.max_query_params or BATCH_SIZE * len(FIELDS)) // len(FIELDS))
+
+    rows = [(external_id, *values) for external_id, values in updates.items()]
+    updated, known, restocked = [], set(), []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'WITH v ({", ".join(columns)}) AS (VALUES {", ".join([placeholder] * len(batch))}) '
+                f'UPDATE {table} AS t SET {sets} FROM v '
+                f'WHERE t.{qn("shop_id")} = %s AND t.{qn("external_id")} = v.{columns[0]} '
+                f'RETURNING {qn("id")}, {qn("external_id")}',
+                [value for row in batch for value in row] + [shop.id])
+            for product_info_id, external_id in cursor.fetchall():
+                updated.append(product_info_id)
+                known.add(external_id)
+                if updates[external_id][2] is not None:
+                    restocked.append(product_info_id)
+        # Новый остаток предложений со слотами делится между слотами
+        distribute_stock(restocked)
+        notify_offers_changed_later(updated)
+    return updated, sorted(set(updates) - known)
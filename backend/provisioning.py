@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+
+from backend.models import Contact, UserTypeChoices
+from backend.tasks import send_emails_registration
+
+
+USER_FIELDS = ('username', 'password', 'email', 'first_name', 'last_name')
+
+CONTACT_FIELDS = ('type', 'phone', 'city', 'street', 'house', 'structure', 'building', 'apartment')
+
+
+def error(row, field, message):
+    return {'row': row, 'field': field, 'error': message}
+
+
+def parse_accounts(records):
+    """
+        Проверка строк CSV (словарей с полями USER_FIELDS и CONTACT_FIELDS) до записи в базу.
+        Возвращает список аккаунтов и ошибки с номерами строк; строка 1 - заголовок
+    """
+
+    accounts, errors, usernames = [], [], {}
+    for row, record in enumerate(records, start=2):
+        if not isinstance(record, dict):
+            errors.append(error(row, '', 'Ожидается словарь с полями пользователя'))
+            continue
+        account, row_errors, invalid = {}, [], set()
+        for key in USER_FIELDS + CONTACT_FIELDS:
+            value = record.get(key)
+            if value is None:
+                value = ''
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            elif not isinstance(value, str):
+                row_errors.append(error(row, key, 'Ожидается строка или число'))
+                invalid.add(key)
+                value = ''
+            account[key] = value if key == 'password' else value.strip()
+
+        for key in USER_FIELDS + CONTACT_FIELDS:
+            model = User if key in USER_FIELDS else Contact
+            max_length = model._meta.get_field(key).max_length
+            if max_length and len(account[key]) > max_length:
+                row_errors.append(error(row, key, f'Длина больше {max_length} символов'))
+        if not account['username']:
+            if 'username' not in invalid:
+                row_errors.append(error(row, 'username', 'Обязательное поле'))
+        elif account['username'] in usernames:
+            row_errors.append(error(row, 'username',
+                                    f'Повтор имени, впервые в строке {usernames[account["username"]]}'))
+        else:
+            usernames[account['username']] = row
+        if not account['password'] and 'password' not in invalid:
+            row_errors.append(error(row, 'password', 'Обязательное поле'))
+        if account['email']:
+            try:
+                validate_email(account['email'])
+            except ValidationError:
+                row_errors.append(error(row, 'email', 'Некорректный адрес'))
+        account['type'] = account['type'].upper() or UserTypeChoices.BUYER
+        if account['type'] not in UserTypeChoices.values:
+            row_errors.append(error(row, 'type', 'Ожидается ' + ' или '.join(UserTypeChoices.values)))
+
+        errors += row_errors
+        if not row_errors:
+            accounts.append(account)
+
+    for username in User.objects.filter(username__in=usernames).values_list('username', flat=True):
+        errors.append(error(usernames[username], 'username', f'Пользователь {username} уже существует'))
+    errors.sort(key=lambda item: item['row'])
+    return accounts, errors
+
+
+def encode_password(hasher, password):
+    # Хешер передается из родительского процесса: дочернему не нужны настройки Django
+    return hasher.encode(password, hasher.salt())
+
+
+def hash_passwords(passwords, workers=None):
+    """
+        Хеши паролей тем же алгоритмом, что make_password, в нескольких процессах
+    """
+
+    hasher = get_hasher('default')
+    workers = workers or settings.PROVISIONING_WORKERS
+    if workers <= 1 or len(passwords) < 2:
+        return [encode_password(hasher, password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(encode_password, [hasher] * len(passwords), passwords,
+                                 chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def queue_welcome_emails(user_ids):
+    """
+        Письма о регистрации отправляются в фоновом потоке после фиксации транзакции
+    """
+
+    def send():
+        try:
+            send_emails_registration(user_ids)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: threading.Thread(target=send).start())
+
+
+def provision_accounts(accounts, workers=None, send_emails=True):
+    """
+        Создание пользователей и их контактов из проверенных parse_accounts строк:
+        пароли хешируются в нескольких процессах, строки вставляются bulk_create пачками
+        PROVISIONING_BATCH_SIZE. Возвращает отчет с числом аккаунтов в секунду
+    """
+
+    started = time.perf_counter()
+    hashes = hash_passwords([account['password'] for account in accounts], workers)
+    hashed = time.perf_counter()
+
+    batch_size = settings.PROVISIONING_BATCH_SIZE
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [User(password=password, **{key: account[key] for key in USER_FIELDS if key != 'password'})
+             for account, password in zip(accounts, hashes)], batch_size=batch_size)
+        if any(user.pk is None for user in users):
+            # База не возвращает id из bulk_create
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list(
+                'username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        Contact.objects.bulk_create(
+            [Contact(user=user, **{key: account[key] or None for key in CONTACT_FIELDS})
+             for account, user in zip(accounts, users)], batch_size=batch_size)
+        if send_emails:
+            queue_welcome_emails([user.pk for user in users if user.email])
+
+    finished = time.perf_counter()
+    seconds = finished - started
+    return {'created': len(users),
+            'seconds': round(seconds, 3),
+            'hashing_seconds': round(hashed - started, 3),
+            'insert_seconds': round(finished - hashed, 3),
+            'accounts_per_second': round(len(users) / seconds, 1) if seconds else None}
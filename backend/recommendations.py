@@ -0,0 +1,125 @@
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from backend.models import OrderItem, ArchivedOrder, OrderStatusChoices, Product, RelatedProduct, RecommendationRun
+
+
+# Сколько связанных товаров хранится для каждого товара
+RELATED_PRODUCTS_LIMIT = 10
+
+CONFIRMED_STATUSES = [OrderStatusChoices.CONFIRMED, OrderStatusChoices.ASSEMBLED,
+                      OrderStatusChoices.SENT, OrderStatusChoices.DELIVERED]
+
+BATCH_SIZE = 1000
+
+
+def archived_order_lines(since, until):
+    """
+        Пары (заказ, товар) архивных заказов: id товара хранится в позициях. Позиции без id
+        и удаленные товары пропускаются
+    """
+
+    queryset = ArchivedOrder.objects.filter(status__in=CONFIRMED_STATUSES, confirmed_at__lte=until)
+    if since is not None:
+        queryset = queryset.filter(confirmed_at__gt=since)
+    lines = [(order_id, ((item.get('product_info') or {}).get('product') or {}).get('id'))
+             for order_id, items in queryset.values_list('id', 'items').iterator(chunk_size=BATCH_SIZE)
+             for item in items]
+    existing = set(Product.objects.filter(id__in={product_id for _, product_id in lines} - {None}).values_list(
+        'id', flat=True))
+    return [(order_id, product_id) for order_id, product_id in lines if product_id in existing]
+
+
+def load_order_lines(since, until, chunk_size=100000):
+    """
+        Пары (заказ, товар) из заказов, подтвержденных в интервале (since, until], в том числе
+        перенесенных в архив, в виде массивов numpy
+    """
+
+    queryset = OrderItem.objects.filter(order__status__in=CONFIRMED_STATUSES, order__confirmed_at__lte=until,
+                                        product_info__isnull=False)
+    if since is not None:
+        queryset = queryset.filter(order__confirmed_at__gt=since)
+    rows = queryset.values_list('order_id', 'product_info__product_id').iterator(chunk_size=chunk_size)
+    archived = archived_order_lines(since, until)
+    flat = np.fromiter(chain.from_iterable(chain(rows, archived)), dtype=np.int64)
+    return flat[0::2], flat[1::2]
+
+
+def cooccurrence(order_ids, product_ids, size):
+    """
+        Матрица совместных покупок: элемент (i, j) - число заказов, где есть и товар i, и товар j
+    """
+
+    _, order_index = np.unique(order_ids, return_inverse=True)
+    baskets = sparse.csr_matrix((np.ones(len(order_index), dtype=np.int32), (order_index, product_ids)),
+                                shape=(order_index.max() + 1, size))
+    # Повторы товара в одном заказе считаются один раз
+    baskets.data[:] = 1
+    matrix = (baskets.T @ baskets).tocsr()
+    matrix = (matrix - sparse.diags(matrix.diagonal(), dtype=matrix.dtype)).tocsr()
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def top_related(matrix, rows, limit):
+    """
+        Первые limit связанных товаров для каждой строки rows (отсортированных по возрастанию).
+        Возвращает массивы товаров, связанных товаров, совместных заказов и мест
+    """
+
+    sub = matrix[rows]
+    counts = np.diff(sub.indptr)
+    row_of = np.repeat(rows, counts)
+    order = np.lexsort((sub.indices, -sub.data, row_of))
+    rank = np.arange(len(order)) - np.repeat(sub.indptr[:-1], counts)
+    mask = rank < limit
+    return row_of[order][mask], sub.indices[order][mask], sub.data[order][mask], rank[mask] + 1
+
+
+def update_related_products(full=False):
+    """
+        Пересчет связанных товаров по заказам, подтвержденным после предыдущего запуска
+    """
+
+    started_at = timezone.now()
+    path = Path(settings.RECOMMENDATIONS_MATRIX_PATH)
+    last_run = RecommendationRun.objects.order_by('-started_at').first()
+    if full or not path.exists():
+        last_run = None
+
+    size = (Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    if last_run is None:
+        matrix = sparse.csr_matrix((size, size), dtype=np.int32)
+    else:
+        matrix = sparse.load_npz(path).tocsr()
+        if matrix.shape[0] < size:
+            matrix.resize((size, size))
+
+    order_ids, product_ids = load_order_lines(last_run.started_at if last_run else None, started_at)
+    if len(order_ids):
+        delta = cooccurrence(order_ids, product_ids, size)
+        matrix = (matrix + delta).tocsr()
+        touched = np.unique(delta.nonzero()[0])
+        products, related, scores, ranks = top_related(matrix, touched, RELATED_PRODUCTS_LIMIT)
+
+        related_products = [RelatedProduct(product_id=product_id, related_id=related_id, score=score, rank=rank)
+                            for product_id, related_id, score, rank in
+                            zip(products.tolist(), related.tolist(), scores.tolist(), ranks.tolist())]
+        touched = touched.tolist()
+        with transaction.atomic():
+            for start in range(0, len(touched), BATCH_SIZE):
+                RelatedProduct.objects.filter(product_id__in=touched[start:start + BATCH_SIZE]).delete()
+            RelatedProduct.objects.bulk_create(related_products, batch_size=BATCH_SIZE)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sparse.save_npz(path, matrix)
+    return RecommendationRun.objects.create(started_at=started_at, finished_at=timezone.now(),
+                                            order_lines=len(order_ids))
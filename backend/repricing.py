@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models import F, Q, Value, Count, Min, Max, Avg, BigIntegerField, Case, When
+from django.db.models.functions import Cast, Greatest, Least
+
+from backend.models import ProductInfo, ProductParameter
+from backend.signals import notify_offers_changed_later
+
+
+HISTOGRAM_BUCKETS = 10
+
+# Процент наценки переводится в сотые доли процента, чтобы считать в целых числах
+BASIS = 10000
+
+# Цены хранятся в PositiveIntegerField, большие наценки ограничиваются его максимумом
+MAX_PRICE = 2 ** 31 - 1
+
+
+def rule_queryset(shop, rule):
+    """
+        Предложения магазина, к которым применяется правило
+    """
+
+    queryset = ProductInfo.objects.filter(shop=shop)
+    if 'category' in rule:
+        queryset = queryset.filter(product__category_id=rule['category'])
+    if 'parameter' in rule:
+        queryset = queryset.filter(id__in=ProductParameter.objects.filter(
+            parameter__name=rule['parameter']['name'], value=rule['parameter']['value']).values('product_info_id'))
+    return queryset
+
+
+def rule_expression(rule, values=None):
+    """
+        Новое значение поля в виде выражения SQL. Вычисления целочисленные, округление вверх.
+        values - выражения текущих значений полей, по умолчанию сами поля
+    """
+
+    base = rule.get('base') or rule['field']
+    factor = BASIS + int(rule['percent'] * BASIS / 100)
+    value = (Cast(values[base] if values else F(base), BigIntegerField()) * Value(factor) + Value(BASIS - 1)) / \
+        Value(BASIS) + Value(rule['add'])
+    value = Greatest(value, Value(0))
+    if 'round_to' in rule:
+        step, ending = rule['round_to'], rule['ending']
+        value = (Greatest(value, Value(ending)) - Value(ending + 1 - step)) / Value(step) * Value(step) + \
+            Value(ending)
+    return Least(value, Value(MAX_PRICE), output_field=BigIntegerField())
+
+
+def price_distribution(queryset, field):
+    """
+        Количество, минимум, максимум, среднее и гистограмма значений поля или выражения
+    """
+
+    queryset = queryset.annotate(value=F(field) if isinstance(field, str) else field)
+    stats = queryset.aggregate(count=Count('id'), min=Min('value'), max=Max('value'), avg=Avg('value'))
+    if stats['avg'] is not None:
+        stats['avg'] = round(stats['avg'], 2)
+    if not stats['count']:
+        return {**stats, 'histogram': []}
+
+    width = -(-(stats['max'] - stats['min'] + 1) // HISTOGRAM_BUCKETS)
+    buckets = queryset.annotate(bucket=(F('value') - Value(stats['min'])) / Value(width)).order_by().values(
+        'bucket').annotate(count=Count('id')).values_list('bucket', 'count')
+    stats['histogram'] = [{'from': stats['min'] + bucket * width,
+                           'to': stats['min'] + (bucket + 1) * width - 1,
+                           'count': count} for bucket, count in sorted(buckets)]
+    return stats
+
+
+def preview_repricing(shop, rules):
+    """
+        Распределение цен до и после каждого правила без UPDATE и блокировок строк: значения полей
+        после предыдущих правил вычисляются в запросе выражениями CASE
+    """
+
+    values = {'price': F('price'), 'price_rrc': F('price_rrc')}
+    report = []
+    for rule in rules:
+        queryset = rule_queryset(shop, rule)
+        new_value = rule_expression(rule, values)
+        before = price_distribution(queryset, values[rule['field']])
+        report.append({'field': rule['field'], 'matched': before['count'],
+                       'before': before, 'after': price_distribution(queryset, new_value)})
+        values[rule['field']] = Case(When(id__in=queryset.values('id'), then=new_value),
+                                     default=values[rule['field']], output_field=BigIntegerField())
+    return report
+
+
+def apply_repricing(shop, rules, dry_run=False):
+    """
+        Применяет правила по порядку, каждое - одним UPDATE. При dry_run цены не меняются,
+        в ответе остается распределение цен до и после каждого правила. Журнал каталога и документы
+        пишутся в транзакции UPDATE, обработчики offers_changed выполняются после фиксации в пуле потоков
+    """
+
+    if dry_run:
+        return preview_repricing(shop, rules)
+
+    report, changed = [], Q(pk__in=[])
+    with transaction.atomic():
+        for rule in rules:
+            queryset = rule_queryset(shop, rule)
+            before = price_distribution(queryset, rule['field'])
+            matched = queryset.update(**{rule['field']: rule_expression(rule)})
+            report.append({'field': rule['field'], 'matched': matched,
+                           'before': before, 'after': price_distribution(queryset, rule['field'])})
+            changed |= Q(id__in=queryset.values('id'))
+        notify_offers_changed_later(ProductInfo.objects.filter(changed))
+    return report
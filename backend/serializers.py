@@ -1,6 +1,10 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Product, Shop, Category, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact
+from .fieldsets import FieldsetSerializerMixin
+from .models import Product, Shop, Category, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact, \
+    CategorySummary
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,16 +28,46 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class ShopCatalogSerializer(ShopSerializer):
+    """
+        Магазин со сводкой по предложениям из аннотаций ShopViewSet.queryset
+    """
+    summary = serializers.SerializerMethodField()
+
+    class Meta(ShopSerializer.Meta):
+        fields = ShopSerializer.Meta.fields + ['summary']
+
+    def get_summary(self, obj):
+        offers = getattr(obj, 'offers', None)
+        if offers is None:
+            return None
+        return {'offers': offers,
+                'in_stock': obj.in_stock,
+                'min_price_rrc': obj.min_price_rrc,
+                'max_price_rrc': obj.max_price_rrc,
+                'avg_price_rrc': round(obj.price_rrc_sum / offers, 2) if offers else None}
+
+
 class ShopOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
         fields = ['name', 'url']
 
 
+class CategorySummarySerializer(serializers.ModelSerializer):
+    avg_price_rrc = serializers.ReadOnlyField()
+
+    class Meta:
+        model = CategorySummary
+        fields = ['offers', 'in_stock', 'min_price_rrc', 'max_price_rrc', 'avg_price_rrc']
+
+
 class CategorySerializer(serializers.ModelSerializer):
+    summary = CategorySummarySerializer(read_only=True)
+
     class Meta:
         model = Category
-        fields = ['id', 'name', ]
+        fields = ['id', 'name', 'summary']
         read_only_fields = ['id']
 
 
@@ -63,7 +97,7 @@ class ProductParameterListingFields(serializers.RelatedField):
         return f'{value.parameter}: {value.value}'
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer()
     shop = ShopSerializer()
     product_parameters = ProductParameterListingFields(queryset=ProductParameter.objects.all(), many=True)
@@ -91,7 +125,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['shop']
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True)
     total_sum = serializers.IntegerField()
     class Meta:
@@ -100,10 +134,40 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     total_sum = serializers.IntegerField()
 
     class Meta:
         model = Order
         fields = ('id', 'status', 'dt', 'total_sum')
         read_only_fields = ('id',)
+
+
+class ParameterMatchSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    value = serializers.CharField(max_length=100)
+
+
+class RepricingRuleSerializer(serializers.Serializer):
+    """
+        Правило переоценки: field = base * (1 + percent / 100) + add с округлением вверх
+        до шага round_to с окончанием ending (round_to=100, ending=90 дает цены вида ...90)
+    """
+    field = serializers.ChoiceField(choices=['price', 'price_rrc'])
+    base = serializers.ChoiceField(choices=['price', 'price_rrc'], required=False)
+    percent = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=Decimal(-100), default=0)
+    add = serializers.IntegerField(default=0)
+    round_to = serializers.IntegerField(min_value=1, required=False)
+    ending = serializers.IntegerField(min_value=0, default=0)
+    category = serializers.IntegerField(required=False)
+    parameter = ParameterMatchSerializer(required=False)
+
+    def validate(self, attrs):
+        if attrs['ending'] and attrs['ending'] >= attrs.get('round_to', 0):
+            raise serializers.ValidationError('ending должен быть меньше round_to')
+        return attrs
+
+
+class RepricingSerializer(serializers.Serializer):
+    rules = RepricingRuleSerializer(many=True, allow_empty=False)
+    dry_run = serializers.BooleanField(default=False)
@@ -0,0 +1,286 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import Signal, receiver
+
+from backend.analytics import rollup_orders
+from backend.documents import refresh_product_documents
+from backend.autocomplete import product_index
+from backend.events import order_bus
+from backend.offers import refresh_best_offers
+from backend.offer_index import offer_index
+from backend.price_history import record_price_changes
+from backend.summaries import refresh_catalog_summaries
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, CatalogChange, Order, \
+    OrderItem, OrderStatusChoices
+
+
+logger = logging.getLogger(__name__)
+
+# Отправляется при изменении предложений (ProductInfo и их параметров), после записи журнала CatalogChange
+# и документов предложений.
+# Аргументы: upserted - id добавленных/измененных, deleted - id удаленных предложений,
+# products - id товаров удаленных предложений (их уже нельзя получить из базы)
+offers_changed = Signal()
+
+# Отправляется при изменении только остатков предложений (резервы при оформлении заказов), после записи
+# журнала и документов. Аргументы те же, что у offers_changed; обработчики - только зависящие от остатка
+stock_changed = Signal()
+
+# Отправляется при смене статуса заказов. Аргументы: order_ids, status
+order_status_changed = Signal()
+
+# Сколько предложений передается обработчикам offers_changed за один сигнал при отложенной рассылке
+NOTIFY_BATCH_SIZE = 5000
+
+_pending = threading.local()
+
+# Потоки для обработчиков offers_changed после массовых изменений; задачи, оставшиеся в очереди
+# при завершении процесса, выполняются до выхода
+_later_executor = ThreadPoolExecutor(max_workers=settings.OFFERS_CHANGED_WORKERS,
+                                     thread_name_prefix='offers-changed')
+
+
+def send_offers_changed(upserted, deleted, products):
+    """
+        Журнал каталога и документы предложений пишутся в текущей транзакции, вместе с самими
+        изменениями, затем рассылается offers_changed
+    """
+    CatalogChange.record(upserted, deleted)
+    refresh_product_documents(upserted)
+    offers_changed.send(sender=ProductInfo, upserted=upserted, deleted=deleted, products=products)
+
+
+def notify_offers_changed(product_info_ids, deleted=False, product_ids=()):
+    """
+        Сообщает об изменении предложений. Внутри collect_offer_changes изменения накапливаются
+    """
+
+    changes = getattr(_pending, 'changes', None)
+    if changes is not None:
+        changes.update(dict.fromkeys(product_info_ids, deleted))
+        _pending.products.update(product_ids)
+        return
+
+    product_info_ids = set(product_info_ids)
+    if product_info_ids:
+        send_offers_changed(upserted=set() if deleted else product_info_ids,
+                            deleted=product_info_ids if deleted else set(),
+                            products=set(product_ids))
+
+
+def notify_stock_changed(product_info_ids):
+    """
+        Сообщает об изменении остатков предложений: одна запись журнала на предложение, документы
+        и обработчики stock_changed вместо полной рассылки offers_changed
+    """
+
+    product_info_ids = set(product_info_ids)
+    if product_info_ids:
+        CatalogChange.record(product_info_ids)
+        refresh_product_documents(product_info_ids)
+        stock_changed.send(sender=ProductInfo, upserted=product_info_ids, deleted=set(), products=set())
+
+
+def id_batches(product_info_ids, batch_size):
+    """ id предложений пачками; выборка ProductInfo читается по возрастанию id, по пачке за запрос """
+
+    if isinstance(product_info_ids, QuerySet):
+        last_id = 0
+        while True:
+            batch = list(product_info_ids.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[
+                :batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]
+    product_info_ids = sorted(set(product_info_ids))
+    for start in range(0, len(product_info_ids), batch_size):
+        yield product_info_ids[start:start + batch_size]
+
+
+def send_offers_changed_later(product_info_ids):
+    """
+        Рассылка offers_changed пачками. Ошибку обработчика send_robust записывает в лог django.dispatch,
+        остальные обработчики и пачки выполняются
+    """
+
+    try:
+        for batch in id_batches(product_info_ids, NOTIFY_BATCH_SIZE):
+            offers_changed.send_robust(sender=ProductInfo, upserted=set(batch), deleted=set(), products=set())
+    except Exception:
+        logger.exception('Рассылка offers_changed прервана')
+    finally:
+        connection.close()
+
+
+def notify_offers_changed_later(product_info_ids):
+    """
+        Изменения массовых операций. Журнал каталога и документы предложений пишутся сразу, в транзакции
+        самих изменений, поэтому ревизия, ETag и ответы каталога меняются вместе с данными.
+        Обработчики offers_changed выполняются после фиксации в пуле из OFFERS_CHANGED_WORKERS потоков,
+        пачками по NOTIFY_BATCH_SIZE.
+        product_info_ids - id или выборка ProductInfo, она читается пачками по id
+    """
+
+    for batch in id_batches(product_info_ids, NOTIFY_BATCH_SIZE):
+        CatalogChange.record(batch)
+        refresh_product_documents(batch)
+    transaction.on_commit(lambda: _later_executor.submit(send_offers_changed_later, product_info_ids))
+
+
+@contextmanager
+def collect_offer_changes():
+    """
+        Накапливает изменения предложений и отправляет один сигнал offers_changed при выходе
+    """
+
+    if getattr(_pending, 'changes', None) is not None:
+        yield
+        return
+
+    _pending.changes, _pending.products = {}, set()
+    try:
+        yield
+    finally:
+        changes, products = _pending.changes, _pending.products
+        _pending.changes = _pending.products = None
+        if changes:
+            send_offers_changed(upserted={pk for pk, deleted in changes.items() if not deleted},
+                                deleted={pk for pk, deleted in changes.items() if deleted},
+                                products=products)
+
+
+@receiver(pre_delete, sender=ProductInfo)
+def remember_deleting(sender, instance, **kwargs):
+    # Характеристики удаляются каскадом раньше предложения: изменением предложения это не считается,
+    # иначе обработчики offers_changed создали бы для него новые строки до его удаления
+    if getattr(_pending, 'deleting', None) is None:
+        _pending.deleting = set()
+    _pending.deleting.add(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        getattr(_pending, 'deleting', set()).discard(instance.pk)
+    notify_offers_changed([instance.pk], deleted=signal is post_delete, product_ids=[instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_changed(sender, instance, **kwargs):
+    if instance.product_info_id not in getattr(_pending, 'deleting', ()):
+        notify_offers_changed([instance.product_info_id])
+
+
+@receiver(pre_save, sender=Product)
+def remember_category(sender, instance, **kwargs):
+    # При переносе товара в другую категорию сводки прежней категории тоже пересчитываются
+    instance._moved_from = instance.pk and sender.objects.filter(pk=instance.pk).exclude(
+        category_id=instance.category_id).values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, created, **kwargs):
+    if not created:
+        notify_offers_changed(instance.product_info.values_list('id', flat=True))
+    if getattr(instance, '_moved_from', None):
+        refresh_catalog_summaries([instance._moved_from])
+
+
+@receiver(post_save, sender=Shop)
+def shop_changed(sender, instance, created, **kwargs):
+    if not created:
+        notify_offers_changed(instance.product_info.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Parameter)
+def remember_renaming(sender, instance, **kwargs):
+    # Названия входят в документы предложений, но сохраняются и без изменений (SupplierUpdate)
+    instance._renamed = instance.pk is not None and \
+        sender.objects.filter(pk=instance.pk).exclude(name=instance.name).exists()
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    if getattr(instance, '_renamed', False):
+        notify_offers_changed(ProductInfo.objects.filter(product__category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Parameter)
+def parameter_changed(sender, instance, created, **kwargs):
+    if getattr(instance, '_renamed', False):
+        notify_offers_changed(instance.product_parameters.values_list('product_info_id', flat=True))
+
+
+@receiver([offers_changed, stock_changed])
+def refresh_offer_ranking(sender, upserted, deleted, products=(), **kwargs):
+    product_ids = set(products)
+    product_ids.update(ProductInfo.objects.filter(id__in=upserted).values_list('product_id', flat=True))
+    refresh_best_offers(product_ids)
+
+
+@receiver([offers_changed, stock_changed])
+def refresh_summaries(sender, upserted, deleted, products=(), **kwargs):
+    # Магазин удаленного предложения неизвестен: его категория пересчитывается целиком,
+    # для остальных - только сводки магазинов измененных предложений
+    if deleted:
+        refresh_catalog_summaries(Product.objects.filter(id__in=products).values_list('category_id', flat=True))
+    changed = list(ProductInfo.objects.filter(id__in=upserted).values_list('shop_id', 'product__category_id'))
+    if changed:
+        shop_ids, category_ids = zip(*changed)
+        refresh_catalog_summaries(category_ids, set(shop_ids))
+
+
+@receiver(offers_changed)
+def refresh_autocomplete(sender, upserted, deleted, products=(), **kwargs):
+    if product_index.built:
+        product_ids = set(products)
+        product_ids.update(ProductInfo.objects.filter(id__in=upserted).values_list('product_id', flat=True))
+        # Как индекс предложений, подсказки перечитываются только после фиксации транзакции
+        transaction.on_commit(lambda: product_index.update_products(product_ids))
+
+
+@receiver([offers_changed, stock_changed])
+def refresh_offer_index(sender, upserted, deleted, **kwargs):
+    if offer_index.built:
+        # Индекс в памяти процесса перечитывает предложения после фиксации: при откате транзакции
+        # в нем не остаются строки, которых нет в базе
+        product_info_ids = set(upserted) | set(deleted)
+        transaction.on_commit(lambda: offer_index.update_offers(product_info_ids))
+
+
+@receiver([offers_changed, stock_changed])
+def record_price_history(sender, upserted, deleted, **kwargs):
+    record_price_changes(upserted)
+
+
+@receiver(order_status_changed)
+def publish_order_status(sender, order_ids, status, **kwargs):
+    subscribed = order_bus.subscribed_users()
+    if not subscribed:
+        return
+
+    recipients = list(Order.objects.filter(id__in=order_ids, user_id__in=subscribed).values_list('id', 'user_id'))
+    recipients += OrderItem.objects.filter(order_id__in=order_ids, shop__owner__user_id__in=subscribed).values_list(
+        'order_id', 'shop__owner__user_id').distinct()
+    for order_id, user_id in recipients:
+        order_bus.publish(user_id, {'order_id': order_id, 'status': status})
+
+
+@receiver(order_status_changed)
+def update_sales_rollups(sender, order_ids, status, **kwargs):
+    rollup_orders(order_ids, status)
+
+
+@receiver(order_status_changed)
+def count_autocomplete_orders(sender, order_ids, status, **kwargs):
+    if status == OrderStatusChoices.NEW and product_index.built:
+        product_index.add_orders(order_ids)
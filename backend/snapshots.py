@@ -0,0 +1,235 @@
+import json
+from datetime import timedelta
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.models import ProductInfo, ProductParameter, CatalogChange, Order, OrderItem, OrderStatusChoices, \
+    ArchivedOrder
+
+
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+# Заказы, измененные незадолго до начала выгрузки, попадают и в следующую: их транзакции могли
+# зафиксироваться позже. Получатель оставляет по id последнюю версию строки
+ORDERS_OVERLAP = timedelta(minutes=5)
+
+OFFERS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('external_id', pa.int64()),
+    ('product_id', pa.int64()),
+    ('product_name', pa.string()),
+    ('category_id', pa.int64()),
+    ('category_name', pa.string()),
+    ('shop_id', pa.int64()),
+    ('shop_name', pa.string()),
+    ('model', pa.string()),
+    ('price', pa.int64()),
+    ('price_rrc', pa.int64()),
+    ('quantity', pa.int64()),
+    ('parameters', pa.map_(pa.string(), pa.string())),
+])
+
+DELETED_OFFERS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+])
+
+ORDERS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('user_id', pa.int64()),
+    ('dt', pa.timestamp('us', tz='UTC')),
+    ('status', pa.string()),
+    ('confirmed_at', pa.timestamp('us', tz='UTC')),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+])
+
+ORDER_ITEMS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('order_id', pa.int64()),
+    ('product_info_id', pa.int64()),
+    ('shop_id', pa.int64()),
+    ('quantity', pa.int64()),
+    ('price_rrc', pa.int64()),
+])
+
+# Заказы, перенесенные в архив, выгружаются отдельной таблицей: позиции хранятся в заказе.
+# Заказ, появившийся в archived_orders, получатель удаляет из orders и order_items по id
+ARCHIVED_ORDERS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('user_id', pa.int64()),
+    ('dt', pa.timestamp('us', tz='UTC')),
+    ('status', pa.string()),
+    ('confirmed_at', pa.timestamp('us', tz='UTC')),
+    ('archived_at', pa.timestamp('us', tz='UTC')),
+    ('total_sum', pa.int64()),
+    ('items', pa.list_(pa.struct([
+        ('product_info_id', pa.int64()),
+        ('product_name', pa.string()),
+        ('shop_name', pa.string()),
+        ('quantity', pa.int64()),
+        ('price_rrc', pa.int64()),
+    ]))),
+])
+
+OFFER_FIELDS = ('id', 'external_id', 'product_id', 'product__name', 'product__category_id',
+                'product__category__name', 'shop_id', 'shop__name', 'model', 'price', 'price_rrc', 'quantity')
+
+ORDER_FIELDS = ('id', 'user_id', 'dt', 'status', 'confirmed_at', 'updated_at')
+
+ORDER_ITEM_FIELDS = ('id', 'order_id', 'product_info_id', 'shop_id', 'quantity', 'product_info__price_rrc')
+
+ARCHIVED_ORDER_FIELDS = ('id', 'user_id', 'dt', 'status', 'confirmed_at', 'archived_at', 'total_sum', 'items')
+
+
+class SnapshotWriter:
+    """
+        Запись таблицы по частям: Parquet (группа строк на часть) или Arrow IPC, который читается
+        без копирования через pyarrow.memory_map
+    """
+
+    def __init__(self, path, schema, file_format):
+        self.path = path
+        self.schema = schema
+        self.rows = 0
+        if file_format == 'parquet':
+            self.writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(str(path), schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        batch = pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+                                schema=self.schema)
+        self.writer.write_batch(batch)
+        self.rows += len(rows)
+
+    def close(self):
+        self.writer.close()
+
+
+def chunks(queryset, fields, chunk_size):
+    """
+        Строки выборки частями по возрастанию id: каждая часть - отдельный запрос по индексу
+        первичного ключа, в памяти не больше chunk_size строк
+    """
+
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def offer_parameters(product_info_ids):
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.filter(
+            product_info_id__in=product_info_ids).values_list('product_info_id', 'parameter__name', 'value'):
+        parameters.setdefault(product_info_id, []).append((name, value))
+    return parameters
+
+
+def offer_chunks(queryset, chunk_size):
+    for rows in chunks(queryset, OFFER_FIELDS, chunk_size):
+        parameters = offer_parameters([row[0] for row in rows])
+        yield [(*row, parameters.get(row[0], [])) for row in rows]
+
+
+def archived_item(item):
+    product_info = item.get('product_info') or {}
+    return {
+        'product_info_id': product_info.get('id'),
+        'product_name': (product_info.get('product') or {}).get('name'),
+        'shop_name': (item.get('shop') or {}).get('name'),
+        'quantity': item.get('quantity'),
+        'price_rrc': product_info.get('price_rrc'),
+    }
+
+
+def archived_order_chunks(queryset, chunk_size):
+    for rows in chunks(queryset, ARCHIVED_ORDER_FIELDS, chunk_size):
+        yield [(*row, [archived_item(item) for item in items]) for *row, items in rows]
+
+
+def read_manifest(directory):
+    path = Path(directory) / 'manifest.json'
+    if not path.exists():
+        return {'snapshots': []}
+    return json.loads(path.read_text(encoding='UTF-8'))
+
+
+def export_snapshot(directory, file_format='parquet', incremental=False, chunk_size=None):
+    """
+        Выгрузка предложений с характеристиками, заказов и позиций заказов в колоночные файлы
+        в подкаталог directory. При incremental выгружаются только предложения, измененные после
+        ревизии каталога прошлой выгрузки (удаленные - отдельным файлом), и заказы, измененные или перенесенные
+        в архив после нее.
+        Сведения о выгрузках хранятся в directory/manifest.json. Возвращает запись о выгрузке
+    """
+
+    chunk_size = chunk_size or settings.SNAPSHOT_CHUNK_SIZE
+    extension = FORMATS[file_format]
+    manifest = read_manifest(directory)
+    previous = manifest['snapshots'][-1] if incremental and manifest['snapshots'] else None
+
+    started_at = timezone.now()
+    revision = CatalogChange.current_revision()
+    target = Path(directory) / started_at.strftime('%Y%m%dT%H%M%S')
+    target.mkdir(parents=True, exist_ok=True)
+
+    offers = ProductInfo.objects.all()
+    orders = Order.objects.exclude(status=OrderStatusChoices.BASKET)
+    archived_orders = ArchivedOrder.objects.all()
+    deleted = []
+    if previous is not None:
+        changes = CatalogChange.objects.filter(id__gt=previous['revision'], id__lte=revision)
+        offers = offers.filter(id__in=changes.filter(deleted=False).values('product_info_id'))
+        deleted = sorted(set(changes.filter(deleted=True).values_list('product_info_id', flat=True)) -
+                         set(ProductInfo.objects.filter(id__in=changes.values('product_info_id')).values_list(
+                             'id', flat=True)))
+        orders_since = parse_datetime(previous['started_at']) - ORDERS_OVERLAP
+        orders = orders.filter(updated_at__gt=orders_since)
+        archived_orders = archived_orders.filter(archived_at__gt=orders_since)
+    order_items = OrderItem.objects.filter(order__in=orders)
+
+    tables = [
+        ('offers', OFFERS_SCHEMA, offer_chunks(offers, chunk_size)),
+        ('offers_deleted', DELETED_OFFERS_SCHEMA,
+         ([(pk,) for pk in deleted[start:start + chunk_size]] for start in range(0, len(deleted), chunk_size))),
+        ('orders', ORDERS_SCHEMA, chunks(orders, ORDER_FIELDS, chunk_size)),
+        ('order_items', ORDER_ITEMS_SCHEMA, chunks(order_items, ORDER_ITEM_FIELDS, chunk_size)),
+        ('archived_orders', ARCHIVED_ORDERS_SCHEMA, archived_order_chunks(archived_orders, chunk_size)),
+    ]
+    files = {}
+    for name, schema, row_chunks in tables:
+        writer = SnapshotWriter(target / f'{name}{extension}', schema, file_format)
+        try:
+            for rows in row_chunks:
+                writer.write(rows)
+        finally:
+            writer.close()
+        files[name] = {'path': str(writer.path.relative_to(directory)), 'rows': writer.rows}
+
+    snapshot = {
+        'path': target.name,
+        'format': file_format,
+        'incremental': previous is not None,
+        'started_at': started_at.isoformat(),
+        'seconds': round((timezone.now() - started_at).total_seconds(), 3),
+        'revision': revision,
+        'files': files,
+    }
+    manifest['snapshots'].append(snapshot)
+    (Path(directory) / 'manifest.json').write_text(json.dumps(manifest, ensure_ascii=False, indent=2),
+                                                   encoding='UTF-8')
+    return snapshot
@@ -0,0 +1,230 @@
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from backend.models import ProductInfo, StockCounterSlot
+from backend.signals import notify_stock_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """ Остатка предложения не хватает для резерва """
+
+    def __init__(self, product_info_id):
+        super().__init__(f'Недостаточно товара: предложение {product_info_id}')
+        self.product_info_id = product_info_id
+
+
+def split(total, slots):
+    """ Равные части total по slots слотам, остаток - в первые слоты """
+    return [total // slots + (1 if number < total % slots else 0) for number in range(slots)]
+
+
+def enable_sharding(product_info_id, slots):
+    """
+        Переносит остаток предложения в slots слотов. Повторный вызов меняет число слотов
+    """
+
+    with transaction.atomic():
+        product_info = ProductInfo.objects.select_for_update().get(pk=product_info_id)
+        total = available(product_info_id)
+        StockCounterSlot.objects.filter(product_info=product_info).delete()
+        StockCounterSlot.objects.bulk_create([
+            StockCounterSlot(product_info=product_info, slot=number, quantity=quantity)
+            for number, quantity in enumerate(split(total, slots))])
+        ProductInfo.objects.filter(pk=product_info_id).update(quantity=total)
+
+
+def disable_sharding(product_info_id):
+    """ Возвращает остаток из слотов в ProductInfo.quantity """
+
+    with transaction.atomic():
+        ProductInfo.objects.select_for_update().filter(pk=product_info_id).update(quantity=available(product_info_id))
+        StockCounterSlot.objects.filter(product_info_id=product_info_id).delete()
+
+
+def available(product_info_id):
+    """ Остаток предложения: сумма по слотам или ProductInfo.quantity, если слотов нет """
+    return available_many([product_info_id]).get(product_info_id, 0)
+
+
+def available_many(product_info_ids):
+    stock = dict(ProductInfo.objects.filter(id__in=product_info_ids).values_list('id', 'quantity'))
+    stock.update(StockCounterSlot.objects.filter(product_info_id__in=product_info_ids).values_list(
+        'product_info_id').annotate(total=Sum('quantity')).order_by())
+    return stock
+
+
+def slot_total(product_info_id):
+    return Subquery(StockCounterSlot.objects.filter(product_info_id=product_info_id).values(
+        'product_info_id').annotate(total=Sum('quantity')).values('total'))
+
+
+def sync_stock(product_info_ids):
+    """
+        Применяет к каталогу остатки, измененные резервами: сумма слотов записывается в ProductInfo.quantity
+        одним UPDATE для всех предложений со слотами, затем notify_stock_changed
+    """
+
+    product_info_ids = set(product_info_ids)
+    with transaction.atomic():
+        ProductInfo.objects.filter(id__in=StockCounterSlot.objects.filter(
+            product_info_id__in=product_info_ids).values('product_info_id')).update(
+            quantity=Coalesce(slot_total(OuterRef('pk')), F('quantity')))
+        notify_stock_changed(product_info_ids)
+
+
+class StockChanges:
+    """
+        Предложения, остаток которых изменили резервы. Оформление заказа только добавляет id после фиксации;
+        не чаще раза в STOCK_SYNC_INTERVAL секунд накопленные изменения применяет sync_stock в отдельном
+        потоке. Так строка популярного предложения не обновляется при каждом оформлении, а журнал,
+        документы и лучшие предложения пересчитываются один раз за интервал. Поток таймера не фоновый:
+        изменения, накопленные к завершению процесса, применяются до выхода
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, product_info_ids):
+        with self._lock:
+            self.pending.update(product_info_ids)
+            if self._timer is None:
+                self._timer = threading.Timer(settings.STOCK_SYNC_INTERVAL, self._flush_later)
+                self._timer.start()
+
+    def flush(self):
+        """ Применяет накопленные изменения сразу """
+        with self._lock:
+            product_info_ids, self.pending = self.pending, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if product_info_ids:
+            sync_stock(product_info_ids)
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Остатки предложений не применены к каталогу')
+        finally:
+            connection.close()
+
+
+stock_changes = StockChanges()
+
+
+def distribute_stock(product_info_ids):
+    """
+        Делит между слотами остаток, записанный поставщиком в ProductInfo.quantity (загрузка прайса,
+        обновление цен). Вызывается в транзакции записи поставщика, слоты блокируются в порядке номеров
+    """
+
+    sharded = set(StockCounterSlot.objects.values_list('product_info_id', flat=True).distinct())
+    for product_info_id in sorted(sharded & set(product_info_ids)):
+        with transaction.atomic():
+            slots = list(StockCounterSlot.objects.select_for_update().filter(
+                product_info_id=product_info_id).order_by('slot'))
+            total = ProductInfo.objects.filter(pk=product_info_id).values_list('quantity', flat=True).first()
+            if not slots or total is None:
+                continue
+            for slot, quantity in zip(slots, split(total, len(slots))):
+                slot.quantity = quantity
+            StockCounterSlot.objects.bulk_update(slots, ['quantity'])
+
+
+def rebalance(product_info_id):
+    """
+        Выравнивает слоты предложения. Слоты блокируются в порядке номеров, поэтому
+        параллельные пересчеты не попадают во взаимную блокировку. Сумма сохраняется в ProductInfo.quantity
+    """
+
+    with transaction.atomic():
+        slots = list(StockCounterSlot.objects.select_for_update().filter(
+            product_info_id=product_info_id).order_by('slot'))
+        if not slots:
+            return
+        total = sum(slot.quantity for slot in slots)
+        for slot, quantity in zip(slots, split(total, len(slots))):
+            slot.quantity = quantity
+        StockCounterSlot.objects.bulk_update(slots, ['quantity'])
+        ProductInfo.objects.filter(pk=product_info_id).update(quantity=total)
+        notify_stock_changed([product_info_id])
+
+
+def reserve(product_info_id, quantity):
+    """
+        Резерв остатка условным UPDATE, который не опускает количество ниже нуля.
+        У предложения со слотами пробуются слоты в случайном порядке; если ни в одном не хватает,
+        количество собирается из нескольких слотов. Вызывается внутри транзакции оформления заказа;
+        после ее фиксации предложение попадает в stock_changes, каталог видит новый остаток
+        через STOCK_SYNC_INTERVAL
+    """
+
+    slot_numbers = list(StockCounterSlot.objects.filter(product_info_id=product_info_id).values_list(
+        'slot', flat=True))
+    if not slot_numbers:
+        if not ProductInfo.objects.filter(pk=product_info_id, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity):
+            raise InsufficientStock(product_info_id)
+        transaction.on_commit(lambda: stock_changes.add([product_info_id]))
+        return
+
+    random.shuffle(slot_numbers)
+    for number in slot_numbers:
+        if StockCounterSlot.objects.filter(product_info_id=product_info_id, slot=number,
+                                           quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            transaction.on_commit(lambda: stock_changes.add([product_info_id]))
+            return
+    reserve_across_slots(product_info_id, quantity)
+
+
+def reserve_across_slots(product_info_id, quantity):
+    """
+        Резерв, для которого не хватает ни одного слота: слоты блокируются в порядке номеров,
+        количество списывается из нескольких слотов, остаток выравнивается
+    """
+
+    with transaction.atomic():
+        slots = list(StockCounterSlot.objects.select_for_update().filter(
+            product_info_id=product_info_id).order_by('slot'))
+        total = sum(slot.quantity for slot in slots)
+        if total < quantity:
+            raise InsufficientStock(product_info_id)
+        for slot, left in zip(slots, split(total - quantity, len(slots))):
+            slot.quantity = left
+        StockCounterSlot.objects.bulk_update(slots, ['quantity'])
+    transaction.on_commit(lambda: stock_changes.add([product_info_id]))
+
+
+def reserve_items(items):
+    """
+        Резерв позиций заказа: пары (product_info_id, количество). Порядок по id предложения
+        исключает взаимные блокировки между заказами
+    """
+
+    totals = {}
+    for product_info_id, quantity in items:
+        if product_info_id is not None:
+            totals[product_info_id] = totals.get(product_info_id, 0) + quantity
+    for product_info_id in sorted(totals):
+        reserve(product_info_id, totals[product_info_id])
+
+
+def rebalance_all():
+    """ Выравнивание слотов всех предложений со слотами, возвращает их число """
+
+    product_info_ids = list(StockCounterSlot.objects.values_list('product_info_id', flat=True).distinct())
+    for product_info_id in product_info_ids:
+        rebalance(product_info_id)
+    return len(product_info_ids)
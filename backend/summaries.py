@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import Count, Min, Max, Sum, Q
+
+from backend.models import Category, ProductInfo, CategorySummary, ShopCategorySummary
+
+
+BATCH_SIZE = 500
+
+SUMMARY_FIELDS = ('offers', 'in_stock', 'min_price_rrc', 'max_price_rrc', 'price_rrc_sum')
+
+
+def refresh_catalog_summaries(category_ids, shop_ids=None):
+    """
+        Пересчет сводок по указанным категориям. shop_ids ограничивает пересчет сводками этих магазинов,
+        итоги категорий складываются из сводок магазинов в базе. Сводки перезаписываются upsert по
+        ключу, лишние удаляются: параллельные пересчеты не сталкиваются на уникальных ключах
+    """
+
+    category_ids = sorted(set(category_ids))
+    for start in range(0, len(category_ids), BATCH_SIZE):
+        batch = category_ids[start:start + BATCH_SIZE]
+        offers = ProductInfo.objects.filter(product__category_id__in=batch)
+        shop_summaries = ShopCategorySummary.objects.filter(category_id__in=batch)
+        if shop_ids is not None:
+            offers = offers.filter(shop_id__in=shop_ids)
+            shop_summaries = shop_summaries.filter(shop_id__in=shop_ids)
+        rows = offers.values_list('shop_id', 'product__category_id').annotate(
+            offers=Count('id'), in_stock=Count('id', filter=Q(quantity__gt=0)),
+            min_price_rrc=Min('price_rrc'), max_price_rrc=Max('price_rrc'),
+            price_rrc_sum=Sum('price_rrc')).order_by('shop_id', 'product__category_id')
+        rows = [ShopCategorySummary(shop_id=shop_id, category_id=category_id, **dict(zip(SUMMARY_FIELDS, values)))
+                for shop_id, category_id, *values in rows]
+
+        with transaction.atomic():
+            ShopCategorySummary.objects.bulk_create(rows, update_conflicts=True, unique_fields=['shop', 'category'],
+                                                    update_fields=SUMMARY_FIELDS)
+            fresh = {(row.shop_id, row.category_id) for row in rows}
+            ShopCategorySummary.objects.filter(id__in=[
+                pk for pk, shop_id, category_id in shop_summaries.values_list('id', 'shop_id', 'category_id')
+                if (shop_id, category_id) not in fresh]).delete()
+
+            totals = {category_id: values for category_id, *values in ShopCategorySummary.objects.filter(
+                category_id__in=batch).values_list('category_id').annotate(
+                Sum('offers'), Sum('in_stock'), Min('min_price_rrc'), Max('max_price_rrc'),
+                Sum('price_rrc_sum')).order_by()}
+            categories = [CategorySummary(category_id=category_id, **dict(zip(SUMMARY_FIELDS, totals.get(
+                category_id, (0, 0, None, None, 0))))) for category_id in Category.objects.filter(
+                id__in=batch).order_by('id').values_list('id', flat=True)]
+            CategorySummary.objects.bulk_create(categories, update_conflicts=True, unique_fields=['category'],
+                                                update_fields=SUMMARY_FIELDS)
@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.contrib.auth.models import User
 
 
@@ -27,3 +27,18 @@ def send_email_order_confirm(user_id: int, **kwargs):
     body = f'Ваш заказ успешно подтвержден'
     message = EmailMultiAlternatives(subject=subject, body=body, from_email=settings.EMAIL_HOST_USER, to=to)
     message.send()
+
+
+def send_emails_registration(user_ids, **kwargs):
+    """
+        Отправка писем о регистрации нескольким пользователям через одно SMTP-соединение
+    """
+
+    messages = [EmailMultiAlternatives(subject='Подтверждение регистрации',
+                                       body=f'Регистрация прошла успешно. Ваш логин: {username}',
+                                       from_email=settings.EMAIL_HOST_USER, to=[email])
+                for username, email in User.objects.filter(id__in=user_ids).exclude(email='').values_list(
+                    'username', 'email')]
+    if messages:
+        with get_connection() as connection:
+            connection.send_messages(messages)
@@ -0,0 +1,143 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+logger = logging.getLogger(__name__)
+
+METRIC_EVENTS = ('allowed', 'throttled', 'rejected')
+
+# Сколько ждать блокировку корзины, занятую параллельным запросом того же пользователя
+BUCKET_LOCK_TIMEOUT = 1
+
+# Срок места в concurrency_limit: место процесса, завершившегося без освобождения, истекает
+# через это время. Должен быть больше самого долгого ограниченного запроса
+CONCURRENCY_SLOT_TIMEOUT = 60 * 60
+
+
+def get_cache():
+    return caches[settings.THROTTLE_CACHE_ALIAS]
+
+
+def record_throttle(scope, event):
+    """ Счетчик событий ограничения запросов в кеше """
+    cache = get_cache()
+    key = f'throttle_metrics:{scope}:{event}'
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def throttle_metrics():
+    """ Счетчики событий по классам эндпоинтов """
+    cache = get_cache()
+    scopes = list(settings.THROTTLE_BUCKETS) + list(settings.CONCURRENCY_LIMITS)
+    return {scope: {event: cache.get(f'throttle_metrics:{scope}:{event}', 0) for event in METRIC_EVENTS}
+            for scope in scopes}
+
+
+@contextmanager
+def cache_lock(cache, key, timeout=BUCKET_LOCK_TIMEOUT):
+    """
+        Блокировка через cache.add, который атомарен в Redis, Memcached и locmem. Не дождавшись
+        блокировки за timeout, блок выполняется без нее: ключ блокировки к этому времени истекает
+    """
+
+    deadline = time.monotonic() + timeout
+    locked = cache.add(key, 1, timeout)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.001)
+        locked = cache.add(key, 1, timeout)
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(key)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+        Ограничение частоты запросов алгоритмом token bucket.
+        Корзина своя у каждого пользователя (анонимных - по IP) в каждом классе эндпоинтов scope,
+        скорость пополнения и размер берутся из settings.THROTTLE_BUCKETS. Корзина хранится в кеше
+        THROTTLE_CACHE_ALIAS и обновляется под блокировкой, чтобы параллельные запросы не тратили один токен
+    """
+    scope = None
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_cache_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'throttle:{self.scope}:user:{request.user.pk}'
+        return f'throttle:{self.scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        rate, burst = settings.THROTTLE_BUCKETS[self.scope]
+        cache = get_cache()
+        key = self.get_cache_key(request)
+
+        with cache_lock(cache, f'{key}:lock'):
+            now = time.time()
+            tokens, updated = cache.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # Полностью восстановившаяся корзина не отличается от отсутствующей
+            cache.set(key, (tokens, now), int(burst / rate) + 1)
+        if not allowed:
+            self.wait_time = (1 - tokens) / rate
+            logger.warning('Запрос ограничен: %s', key)
+        record_throttle(self.scope, 'allowed' if allowed else 'throttled')
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class ImportRateThrottle(TokenBucketThrottle):
+    scope = 'import'
+
+
+class PriceUpdateRateThrottle(TokenBucketThrottle):
+    scope = 'prices'
+
+
+class BasketRateThrottle(TokenBucketThrottle):
+    scope = 'basket'
+
+
+class CatalogRateThrottle(TokenBucketThrottle):
+    scope = 'catalog'
+
+
+@contextmanager
+def concurrency_limit(scope):
+    """
+        Не больше settings.CONCURRENCY_LIMITS[scope] одновременных выполнений блока во всех процессах,
+        использующих кеш THROTTLE_CACHE_ALIAS, при превышении - ответ 429 с Retry-After.
+        Каждое выполнение занимает одно из мест concurrency:<scope>:<номер> атомарным cache.add
+        со сроком CONCURRENCY_SLOT_TIMEOUT: место упавшего процесса освобождается само
+    """
+
+    limit, retry_after = settings.CONCURRENCY_LIMITS[scope]
+    cache = get_cache()
+    holder = uuid.uuid4().hex
+    key = next((key for key in (f'concurrency:{scope}:{number}' for number in range(limit))
+                if cache.add(key, holder, CONCURRENCY_SLOT_TIMEOUT)), None)
+    if key is None:
+        record_throttle(scope, 'rejected')
+        logger.warning('Превышено число одновременных запросов: %s', scope)
+        raise Throttled(wait=retry_after)
+    try:
+        yield
+    finally:
+        # Место, истекшее во время выполнения, может быть уже занято другим запросом
+        if cache.get(key) == holder:
+            cache.delete(key)
@@ -1,20 +1,63 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.utils import IntegrityError
-from django.db.models import Sum, F
+from django.db import transaction
+from django.db.models import Sum, F, Min, Max
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.parsers import JSONParser
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from django.contrib.auth.models import User
 from rest_framework.response import Response
-import yaml
-from backend.models import Product, Shop, Category, Order, Contact, OrderItem, ProductInfo, Parameter, ProductParameter
-from backend.serializers import ShopSerializer, CategorySerializer, OrderSerializer, \
-    ProductInfoSerializer, ParameterSerializer, OrderDetailSerializer, ContactSerializer, OrderItemSerializer, \
-    UserSerializer
+from backend.models import Product, Shop, Category, Order, Contact, OrderItem, ProductInfo, Parameter, \
+    ProductParameter, CatalogChange, BestOffer, RelatedProduct, DailySales, ArchivedOrder, SHOP_ORDER_TRANSITIONS, \
+    ImportStatusChoices, ProductDocument
+from backend.serializers import ShopCatalogSerializer, CategorySerializer, OrderSerializer, \
+    ProductInfoSerializer, ParameterSerializer, OrderDetailSerializer, ContactSerializer, \
+    UserSerializer, RepricingSerializer
 from backend.tasks import send_email_order_confirm, send_email_registration
+from backend.fast_serializers import product_info_data, order_data, order_detail_data, archived_order_data, \
+    archived_order_detail_data
+from backend.signals import collect_offer_changes, order_status_changed
+from backend.baskets import get_basket
+from backend.stock import InsufficientStock, available, distribute_stock
+from backend.analytics import MAX_TOP_PRODUCTS
+from backend.throttling import ImportRateThrottle, BasketRateThrottle, CatalogRateThrottle, PriceUpdateRateThrottle, \
+    concurrency_limit, throttle_metrics
+from backend.parsers import CSVParser
+from backend.price_updates import parse_price_updates, apply_price_updates
+from backend.repricing import apply_repricing
+from backend.import_validation import validate_price_list_file
+from backend.import_profiling import ImportProfiler
+from backend.autocomplete import product_index
+from backend.documents import product_documents, document_data, documents_by_id
+from backend.fieldsets import Fieldset, PRODUCT_INFO_FIELDS, ORDER_FIELDS, ORDER_DETAIL_FIELDS
+from backend.offer_index import offer_index, catalog_query_requested, parse_offer_query, sql_offers
+from backend.provisioning import parse_accounts, provision_accounts
+from backend.price_history import price_history, RESOLUTIONS, MAX_HISTORY_POINTS
+
+
+def parse_moment(value):
+    """ Дата или дата и время из параметра запроса; без часового пояса - в текущем """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
 
 
 class UserRegistrationView(APIView):
@@ -49,6 +92,43 @@ class UserRegistrationView(APIView):
         return Response({'status': 'Пользователь изменен'})
 
 
+class AccountProvisioningView(APIView):
+    """
+        Массовое создание покупателей с контактами из CSV (или JSON-списка) для подключения торговых сетей.
+        Поля: username, password, email, first_name, last_name, type, phone, city, street, house, structure,
+        building, apartment. Письма о регистрации отправляются в фоне
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [CSVParser, JSONParser]
+
+    def post(self, request):
+        records = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(records, list):
+            return Response({'status': 'Ожидается список пользователей'}, status=400)
+
+        accounts, errors = parse_accounts(records)
+        if errors:
+            return Response({'status': 'Ошибки в данных', 'errors': errors}, status=400)
+
+        with concurrency_limit('provisioning'):
+            try:
+                report = provision_accounts(accounts)
+            except IntegrityError:
+                return Response({'status': 'Пользователь с таким именем уже существует'}, status=409)
+        return Response({'status': 'Пользователи созданы', **report}, status=201)
+
+
+class ThrottleMetricsView(APIView):
+    """
+        Счетчики ограничения запросов по классам эндпоинтов: allowed, throttled, rejected.
+        Счетчики хранятся в кеше THROTTLE_CACHE_ALIAS: с кешем в памяти процесса - только этого процесса
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(throttle_metrics())
+
+
 class LoginView(APIView):
     """
         Аутентификация пользователя
@@ -110,32 +190,223 @@ class ContactView(APIView):
 
 
 class ShopViewSet(ModelViewSet):
-    queryset = Shop.objects.all()
-    serializer_class = ShopSerializer
+    # Сводка магазина складывается из его сводок по категориям в том же запросе
+    queryset = Shop.objects.annotate(
+        offers=Sum('category_summaries__offers'), in_stock=Sum('category_summaries__in_stock'),
+        min_price_rrc=Min('category_summaries__min_price_rrc'), max_price_rrc=Max('category_summaries__max_price_rrc'),
+        price_rrc_sum=Sum('category_summaries__price_rrc_sum')).order_by('id')
+    serializer_class = ShopCatalogSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogRateThrottle]
     filterset_fields = ['name']
 
 
 class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.select_related('summary')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogRateThrottle]
     filterset_fields = ['name', 'shops']
 
 
 class ProductViewSet(ModelViewSet):
     serializer_class = ProductInfoSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogRateThrottle]
     queryset = ProductInfo.objects.all().select_related('product', 'shop')
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['product', 'model', 'product_parameters', 'shop']
     search_fields = ['product', 'model', 'product_parameters', 'shop', 'quantity', 'price', 'price_rrc']
+    fieldset = None
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fieldset': self.fieldset}
+
+    @staticmethod
+    def catalog_etag(request):
+        """
+            Ревизия каталога, ETag по ней и признак совпадения ETag с If-None-Match
+        """
+        revision = CatalogChange.current_revision()
+        etag = f'"catalog-{revision}"'
+        return revision, etag, etag in parse_etags(request.headers.get('If-None-Match', ''))
+
+    def list(self, request, *args, **kwargs):
+        _, etag, not_modified = self.catalog_etag(request)
+        if not_modified:
+            return Response(status=304, headers={'ETag': etag})
+
+        try:
+            self.fieldset = Fieldset.from_request(request, PRODUCT_INFO_FIELDS)
+        except ValueError as error:
+            return Response({'status': str(error)}, status=400)
+
+        if catalog_query_requested(request.query_params):
+            return self.catalog_query(request, etag, self.fieldset)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(product_documents(queryset, self.fieldset), headers={'ETag': etag})
+
+    @staticmethod
+    def catalog_query(request, etag, fieldset=None):
+        """
+            Предложения с фильтрами category, shop, in_stock, parameter=Название:значение, сортировкой ordering
+            и страницей limit/offset. Общее число - в заголовке X-Total-Count. При OFFER_INDEX_ENABLED запрос
+            выполняется по индексу предложений в памяти, иначе в базе
+        """
+        try:
+            query = parse_offer_query(request.query_params)
+        except ValueError as error:
+            return Response({'status': f'Некорректные параметры запроса: {error}'}, status=400)
+
+        if settings.OFFER_INDEX_ENABLED:
+            offer_index.sync()
+            total, ids = offer_index.query(query)
+        else:
+            total, ids = sql_offers(query)
+        return Response(documents_by_id(ids, fieldset), headers={'ETag': etag, 'X-Total-Count': str(total)})
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        try:
+            self.fieldset = Fieldset.from_request(request, PRODUCT_INFO_FIELDS)
+        except ValueError as error:
+            return Response({'status': str(error)}, status=400)
+
+        document = ProductDocument.objects.filter(product_info_id=pk).values_list('document', flat=True).first()
+        if document is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.fieldset.prune(document_data(document)))
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+            Изменения каталога начиная с ревизии since
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({'status': 'Ревизия должна быть целым числом'}, status=400)
+
+        revision, etag, not_modified = self.catalog_etag(request)
+        if not_modified:
+            return Response(status=304, headers={'ETag': etag})
+
+        # Для каждого предложения важно только последнее изменение
+        last_changes = dict(CatalogChange.objects.filter(id__gt=since, id__lte=revision).order_by(
+            'id').values_list('product_info_id', 'deleted'))
+        upserted = product_info_data(ProductInfo.objects.filter(
+            id__in=[pk for pk, deleted in last_changes.items() if not deleted]).order_by('id'), with_id=True)
+        found = {item['id'] for item in upserted}
+        deleted = sorted(pk for pk in last_changes if pk not in found)
+
+        return Response({'revision': revision, 'upserted': upserted, 'deleted': deleted}, headers={'ETag': etag})
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        """
+            Подсказки при вводе: популярные товары, в названии, модели или категории которых
+            есть слово, начинающееся с q
+        """
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'status': 'limit должен быть положительным целым числом'}, status=400)
+
+        product_index.sync()
+        return Response(product_index.search(request.query_params.get('q', ''), limit))
+
+    @action(detail=True)
+    def stock(self, request, pk=None):
+        """
+            Текущий остаток предложения с учетом резервов (сумма по слотам для популярных предложений)
+        """
+        product_info = self.get_object()
+        return Response({'product_info': product_info.id, 'quantity': available(product_info.id),
+                         'sharded': product_info.stock_slots.exists()})
+
+    @action(detail=True)
+    def offers(self, request, pk=None):
+        """
+            Самое дешевое предложение этого товара в наличии и альтернативы в других магазинах
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            return Response({'status': 'Идентификатор предложения должен быть целым числом'}, status=400)
+        product_id = ProductInfo.objects.filter(pk=pk).values_list('product_id', flat=True).first()
+        if product_id is None:
+            return Response({'status': 'Предложение не найдено'}, status=404)
+
+        offers = BestOffer.objects.filter(product_id=product_id).order_by('rank').values_list(
+            'rank', 'product_info_id', 'price_rrc', 'quantity', 'shop_id', 'shop__name')
+        return Response([{
+            'rank': rank,
+            'product_info': product_info_id,
+            'price_rrc': price_rrc,
+            'quantity': quantity,
+            'shop': {'id': shop_id, 'name': shop_name},
+        } for rank, product_info_id, price_rrc, quantity, shop_id, shop_name in offers])
+
+    @action(detail=True)
+    def related(self, request, pk=None):
+        """
+            Товары, которые часто покупают вместе с этим товаром
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            return Response({'status': 'Идентификатор предложения должен быть целым числом'}, status=400)
+        product_id = ProductInfo.objects.filter(pk=pk).values_list('product_id', flat=True).first()
+        if product_id is None:
+            return Response({'status': 'Предложение не найдено'}, status=404)
+
+        related = RelatedProduct.objects.filter(product_id=product_id).order_by('rank').values_list(
+            'related_id', 'related__name', 'related__category__name', 'score')
+        return Response([{'id': related_id, 'name': name, 'category': category, 'orders': score}
+                         for related_id, name, category, score in related])
+
+    @action(detail=True)
+    def history(self, request, pk=None):
+        """
+            История цены, РРЦ и остатка предложения, прореженная до шага resolution (minute, hour, day, week).
+            Период: start - end (ГГГГ-ММ-ДД или дата и время ISO), по умолчанию последние 30 дней
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            return Response({'status': 'Идентификатор предложения должен быть целым числом'}, status=400)
+        if not ProductInfo.objects.filter(pk=pk).exists():
+            return Response({'status': 'Предложение не найдено'}, status=404)
+
+        try:
+            end = parse_moment(request.query_params.get('end')) or timezone.now()
+            start = parse_moment(request.query_params.get('start')) or end - timedelta(days=30)
+        except ValueError:
+            return Response({'status': 'Даты ожидаются в формате ГГГГ-ММ-ДД или ГГГГ-ММ-ДДTЧЧ:ММ:СС'}, status=400)
+        resolution = request.query_params.get('resolution', 'day')
+        if resolution not in RESOLUTIONS:
+            return Response({'status': 'Шаг истории: ' + ', '.join(RESOLUTIONS)}, status=400)
+        if start >= end:
+            return Response({'status': 'Начало периода должно быть раньше конца'}, status=400)
+        if (end - start).total_seconds() / RESOLUTIONS[resolution] > MAX_HISTORY_POINTS:
+            return Response({'status': f'Больше {MAX_HISTORY_POINTS} интервалов, выберите более крупный шаг'},
+                            status=400)
+
+        return Response({'product_info': pk, 'start': start, 'end': end, 'resolution': resolution,
+                         'points': price_history(pk, start, end, RESOLUTIONS[resolution])})
 
 
 class ParameterViewSet(ModelViewSet):
     queryset = Parameter.objects.all()
     serializer_class = ParameterSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_classes = [CatalogRateThrottle]
 
 
 class BasketView(APIView):
@@ -144,6 +415,7 @@ class BasketView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [BasketRateThrottle]
 
     def put(self, request):
         """ Добавление товара в корзину """
@@ -151,13 +423,15 @@ class BasketView(APIView):
         if request.user.contact.type != 'BUYER':
             return Response({'status': 'Только покупатели могут добавлять товары в корзину'})
 
-        basket, _ = Order.objects.get_or_create(user=request.user, status='BASKET')
-        product = Product.objects.get(id=request.data.get('product_id'))
-        shop = ProductInfo.objects.get(id=product.id).shop
-        product_info = ProductInfo.objects.get(product=product)
-        quantity = request.data.get('quantity')
+        # Добавляется самое дешевое предложение товара в наличии
+        offer = BestOffer.objects.filter(product_id=request.data.get('product_id'), rank=1).values_list(
+            'product_info_id', 'shop_id').first()
+        if offer is None:
+            return Response({'status': 'Товар отсутствует в наличии'}, status=404)
+        product_info_id, shop_id = offer
 
-        OrderItem.objects.create(order=basket, product_info=product_info, shop=shop, quantity=quantity)
+        get_basket(request.user).add(product_info_id, request.data.get('product_id'), shop_id,
+                                     request.data.get('quantity'))
         return Response({'status': 'Товар добавлен в корзину'})
 
     def get(self, request):
@@ -166,13 +440,7 @@ class BasketView(APIView):
         if request.user.contact.type != 'BUYER':
             return Response({'status': 'Только для покупателей!'})
 
-        basket = Order.objects.filter(
-            user_id=request.user.id, status='BASKET').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc'))).distinct()
-        serializer = OrderDetailSerializer(basket, many=True)
-        return Response(serializer.data)
+        return Response(get_basket(request.user).data())
 
     def patch(self, request):
         """
@@ -183,11 +451,7 @@ class BasketView(APIView):
             return Response({'status': 'Только для покупателей!'})
 
         try:
-            order_item = OrderItem.objects.get(order__user=request.user, order__status='BASKET',
-                                               product_info__product=request.data.get('product_id'))
-            serializer = OrderItemSerializer(order_item, data=request.data, partial=True)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            get_basket(request.user).update(request.data.get('product_id'), request.data)
             return Response({'status': 'Количество товара изменено'})
         except ObjectDoesNotExist:
             return Response({'status': 'Указанный товар отсутствует в корзине'}, status=404)
@@ -201,9 +465,7 @@ class BasketView(APIView):
             return Response({'status': 'Только для покупателей!'})
 
         try:
-            order_item = OrderItem.objects.get(order__user=request.user, order__status='BASKET',
-                                               product_info__product=request.data.get('product_id'))
-            order_item.delete()
+            get_basket(request.user).remove(request.data.get('product_id'))
             return Response({'status': 'Товар удален из корзины'})
         except ObjectDoesNotExist:
             return Response({'status': 'Указанный товар отсутствует в корзине'}, status=404)
@@ -213,33 +475,92 @@ class BasketView(APIView):
 class SupplierUpdate(APIView):
     """Загрузка информации о магазине, категориях товаров, товарах, характеристиках."""
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ImportRateThrottle]
 
     def post(self, request, file_name):
 
         if request.user.contact.type != 'SHOP':
             return Response({'status': 'Загрузка доступна только магазину'})
 
-        with open(f'{file_name}', 'r', encoding='UTF-8') as f:
-            data = yaml.safe_load(f)
-            shop, _ = Shop.objects.get_or_create(name=data['shop'], owner=request.user.contact)
-            for category in data['categories']:
-                category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                category_object.shops.add(shop.id)
-                category_object.save()
+        profiler = ImportProfiler(request.user, file_name, profile=request.query_params.get('profile') == '1')
+        with concurrency_limit('import'), profiler.start():
+            with profiler.stage('parse'):
+                data, errors = validate_price_list_file(file_name, request.user.contact)
+            if errors:
+                profiler.status = ImportStatusChoices.INVALID
+                return Response({'status': 'Ошибки в прайсе, данные не загружены', 'errors': errors,
+                                 'import_run': profiler.run.id}, status=400)
+            self.load(data, request.user.contact, profiler)
+        return Response({'status': 'products added successfully',
+                         'import_run': profiler.run.id,
+                         'stages': profiler.run.stages})
+
+    @staticmethod
+    def load(data, owner, profiler):
+        # commit - открытие и фиксация транзакции, signals - журнал каталога, документы и рассылка offers_changed
+        # в конце транзакции загрузки: ответы каталога меняются вместе с данными
+        with profiler.stage('commit'), transaction.atomic(), profiler.stage('signals'), collect_offer_changes():
+            with profiler.stage('categories'):
+                shop, _ = Shop.objects.get_or_create(name=data['shop'], owner=owner)
+                for category in data['categories']:
+                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
+                    category_object.shops.add(shop.id)
+                    category_object.save()
+                profiler.count('categories', len(data['categories']))
+            product_info_ids = []
+            # Предложения, загруженные до появления external_id
+            legacy = ProductInfo.objects.filter(shop_id=shop.id, external_id__isnull=True).exists()
             for item in data['goods']:
-                product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-                product_info = ProductInfo.objects.create(product_id=product.id,
-                                                          shop_id=shop.id,
-                                                          model=item['model'],
-                                                          quantity=item['quantity'],
-                                                          price=item['price'],
-                                                          price_rrc=item['price_rrc'])
-                for key, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=key)
-                    ProductParameter.objects.create(product_info_id=product_info.id,
-                                                    parameter_id=parameter_object.id,
-                                                    value=value)
-        return Response({'status': 'products added successfully'})
+                with profiler.stage('products'):
+                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
+                    profiler.count('products')
+                with profiler.stage('offers'):
+                    if legacy and not ProductInfo.objects.filter(shop_id=shop.id, external_id=item['id']).exists():
+                        # Сопоставляются по товару и модели, иначе первая загрузка прайса создала бы дубли
+                        ProductInfo.objects.filter(pk=ProductInfo.objects.filter(
+                            shop_id=shop.id, external_id__isnull=True, product_id=product.id,
+                            model=item['model']).order_by('id').values('id')[:1]).update(external_id=item['id'])
+                    product_info, _ = ProductInfo.objects.update_or_create(shop_id=shop.id,
+                                                                           external_id=item['id'],
+                                                                           defaults={'product_id': product.id,
+                                                                                     'model': item['model'],
+                                                                                     'quantity': item['quantity'],
+                                                                                     'price': item['price'],
+                                                                                     'price_rrc': item['price_rrc']})
+                    product_info.product_parameters.all().delete()
+                    product_info_ids.append(product_info.id)
+                    profiler.count('offers')
+                with profiler.stage('parameters'):
+                    for key, value in item['parameters'].items():
+                        parameter_object, _ = Parameter.objects.get_or_create(name=key)
+                        ProductParameter.objects.create(product_info_id=product_info.id,
+                                                        parameter_id=parameter_object.id,
+                                                        value=value)
+                    profiler.count('parameters', len(item['parameters']))
+            with profiler.stage('offers'):
+                # Остаток из прайса у предложений со слотами делится между слотами
+                distribute_stock(product_info_ids)
+
+
+class PriceListValidationView(APIView):
+    """
+        Проверка прайса без загрузки в базу
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ImportRateThrottle]
+
+    def post(self, request, file_name):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Проверка доступна только магазину'})
+
+        with concurrency_limit('import'):
+            data, errors = validate_price_list_file(file_name, request.user.contact)
+        if errors:
+            return Response({'status': 'Ошибки в прайсе', 'errors': errors}, status=400)
+        return Response({'status': 'Прайс корректен',
+                         'categories': len(data['categories']),
+                         'goods': len(data['goods'])})
 
 
 class OrderViewSet(ModelViewSet):
@@ -251,9 +572,13 @@ class OrderViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
     detail_serializer_class = OrderDetailSerializer
+    fieldset = None
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.fieldset is not None and 'total_sum' not in self.fieldset.tree:
+            # Без суммы заказа не нужны соединение с позициями и группировка
+            queryset = Order.objects.all()
         if self.action == 'list':
             return queryset.filter(user=self.request.user).exclude(status='BASKET').prefetch_related(
                 'order_items__product_info').all()
@@ -267,6 +592,35 @@ class OrderViewSet(ModelViewSet):
                 return self.detail_serializer_class
         return super(OrderViewSet, self).get_serializer_class()
 
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fieldset': self.fieldset}
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.fieldset = Fieldset.from_request(request, ORDER_FIELDS)
+        except ValueError as error:
+            return Response({'status': str(error)}, status=400)
+
+        # Завершенные заказы из архива идут после текущих
+        return Response(order_data(self.get_queryset(), self.fieldset) + archived_order_data(
+            ArchivedOrder.objects.filter(user=request.user).order_by('dt'), self.fieldset))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        try:
+            self.fieldset = Fieldset.from_request(request, ORDER_DETAIL_FIELDS)
+        except ValueError as error:
+            return Response({'status': str(error)}, status=400)
+
+        data = order_detail_data(self.get_queryset().filter(pk=pk), self.fieldset) or archived_order_detail_data(
+            ArchivedOrder.objects.filter(user=request.user, pk=pk), self.fieldset)
+        if not data:
+            raise Http404
+        return Response(data[0])
+
 
 class CreatingOrderView(APIView):
     """
@@ -280,12 +634,14 @@ class CreatingOrderView(APIView):
             return Response({'status': 'Только для покупателей!'})
 
         try:
-            order = Order.objects.get(user=request.user, status='BASKET')
-        except Order.DoesNotExist:
+            order = get_basket(request.user).checkout()
+        except InsufficientStock as exc:
+            return Response({'status': 'Недостаточно товара в наличии', 'product_info': exc.product_info_id},
+                            status=409)
+        if order is None:
             return Response({'status': 'У пользователя отсутствует товары в корзине'})
 
-        order.status = 'NEW'
-        order.save()
+        order_status_changed.send(sender=Order, order_ids=[order.id], status=order.status)
         return Response({'status': 'Заказ создан'})
 
 
@@ -306,6 +662,166 @@ class ConfirmOrderView(APIView):
             return Response({'status': 'У пользователя отсутствуют новые неподтвержденные заказы'})
 
         order.status = 'CONFIRMED'
+        order.confirmed_at = timezone.now()
         order.save()
+        order_status_changed.send(sender=Order, order_ids=[order.id], status=order.status)
         send_email_order_confirm(order.user.id)
         return Response({'status': 'Заказ подтвержден'})
+
+
+class ShopOrderView(APIView):
+    """
+        Просмотр заказов с товарами магазина
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Только для магазинов!'})
+
+        shop = Shop.objects.filter(owner=request.user.contact).first()
+        if shop is None:
+            return Response({'status': 'У пользователя нет магазина'}, status=404)
+
+        orders = Order.objects.filter(order_items__shop=shop).exclude(status='BASKET')
+        if request.query_params.get('status'):
+            orders = orders.filter(status=request.query_params['status'])
+        # Сумма считается только по товарам этого магазина
+        orders = orders.annotate(
+            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc'))).order_by('-dt')
+        return Response(order_data(orders))
+
+
+class ShopOrderStatusView(APIView):
+    """
+        Перевод заказов магазина в следующий статус
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Только для магазинов!'})
+
+        shop = Shop.objects.filter(owner=request.user.contact).first()
+        if shop is None:
+            return Response({'status': 'У пользователя нет магазина'}, status=404)
+
+        status = request.data.get('status')
+        previous = {new: old for old, new in SHOP_ORDER_TRANSITIONS.items()}.get(status)
+        if previous is None:
+            return Response({'status': f'Недопустимый статус: {status}'}, status=400)
+
+        order_ids = request.data.get('order_ids')
+        if not isinstance(order_ids, list) or not all(isinstance(pk, int) for pk in order_ids):
+            return Response({'status': 'order_ids должен быть списком идентификаторов заказов'}, status=400)
+
+        # Переводятся только заказы магазина в предыдущем статусе, одним UPDATE
+        with transaction.atomic():
+            moved = list(Order.objects.select_for_update().filter(id__in=order_ids, status=previous).filter(
+                id__in=OrderItem.objects.filter(shop=shop).values('order_id')).values_list('id', flat=True))
+            Order.objects.filter(id__in=moved).update(status=status, updated_at=timezone.now())
+        if moved:
+            order_status_changed.send(sender=Order, order_ids=moved, status=status)
+
+        return Response({'status': 'Статус заказов изменен',
+                         'updated': sorted(moved),
+                         'rejected': sorted(set(order_ids) - set(moved))})
+
+
+class PriceUpdateView(APIView):
+    """
+        Обновление цен и остатков предложений магазина по идентификаторам поставщика (JSON или CSV)
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [PriceUpdateRateThrottle]
+    parser_classes = [JSONParser, CSVParser]
+
+    def post(self, request):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Только для магазинов!'})
+
+        shop = Shop.objects.filter(owner=request.user.contact).first()
+        if shop is None:
+            return Response({'status': 'У пользователя нет магазина'}, status=404)
+
+        records = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(records, list):
+            return Response({'status': 'Ожидается список записей external_id, price, price_rrc, quantity'},
+                            status=400)
+
+        updates, errors = parse_price_updates(records)
+        if errors:
+            return Response({'status': 'Ошибки в данных', 'errors': errors}, status=400)
+
+        updated, unknown = apply_price_updates(shop, updates)
+        return Response({'status': 'Цены и остатки обновлены',
+                         'updated': len(updated),
+                         'unknown': unknown})
+
+
+class RepricingView(APIView):
+    """
+        Переоценка предложений магазина по правилам, с предварительным просмотром (dry_run)
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [PriceUpdateRateThrottle]
+
+    def post(self, request):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Только для магазинов!'})
+
+        shop = Shop.objects.filter(owner=request.user.contact).first()
+        if shop is None:
+            return Response({'status': 'У пользователя нет магазина'}, status=404)
+
+        serializer = RepricingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        dry_run = serializer.validated_data['dry_run']
+        report = apply_repricing(shop, serializer.validated_data['rules'], dry_run=dry_run)
+        return Response({'status': 'Предварительный просмотр' if dry_run else 'Цены изменены',
+                         'dry_run': dry_run,
+                         'rules': report})
+
+
+class ShopAnalyticsView(APIView):
+    """
+        Продажи магазина за период по дневным итогам
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+
+        if request.user.contact.type != 'SHOP':
+            return Response({'status': 'Только для магазинов!'})
+
+        shop = Shop.objects.filter(owner=request.user.contact).first()
+        if shop is None:
+            return Response({'status': 'У пользователя нет магазина'}, status=404)
+
+        try:
+            date_to = parse_date(request.query_params.get('date_to', '')) or timezone.localdate()
+            date_from = parse_date(request.query_params.get('date_from', '')) or date_to - timedelta(days=29)
+            top = int(request.query_params.get('top', 10))
+        except ValueError:
+            return Response({'status': 'Даты ожидаются в формате ГГГГ-ММ-ДД, top - целое число'}, status=400)
+        if not 0 < top <= MAX_TOP_PRODUCTS:
+            return Response({'status': f'top должен быть от 1 до {MAX_TOP_PRODUCTS}'}, status=400)
+
+        sales = DailySales.objects.filter(shop=shop, day__range=(date_from, date_to))
+        totals = {name: Sum(name) for name in ('units', 'revenue', 'delivered_units', 'delivered_revenue')}
+
+        return Response({
+            'date_from': date_from,
+            'date_to': date_to,
+            'totals': {name: value or 0 for name, value in sales.aggregate(**totals).items()},
+            'by_day': list(sales.values('day').annotate(**totals).order_by('day')),
+            'by_category': list(sales.values('category_id', 'category__name').annotate(**totals).order_by(
+                '-revenue')),
+            'top_products': list(sales.values('product_id', 'product__name').annotate(**totals).order_by(
+                '-revenue')[:top]),
+        })
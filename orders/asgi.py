@@ -3,6 +3,9 @@ ASGI config for orders project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The order status stream (``/orders/events/``) is an async view and needs
+this application, e.g. ``uvicorn orders.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -133,6 +133,70 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'baskets': {
+        'BACKEND': os.getenv('BASKET_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('BASKET_CACHE_LOCATION', 'baskets'),
+    },
+}
+
+# Хранилище корзин: backend.baskets.DatabaseBasket (Order/OrderItem) или backend.baskets.CacheBasket
+# (кеш BASKET_CACHE_ALIAS, например FileBasedCache с BASKET_CACHE_LOCATION=/var/tmp/baskets)
+BASKET_BACKEND = os.getenv('BASKET_BACKEND', 'backend.baskets.DatabaseBasket')
+BASKET_CACHE_ALIAS = 'baskets'
+BASKET_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Ограничение частоты запросов: класс эндпоинтов -> (запросов в секунду, размер пачки)
+THROTTLE_BUCKETS = {
+    'import': (1 / 60, 3),
+    'prices': (1 / 10, 10),
+    'basket': (5, 30),
+    'catalog': (20, 100),
+}
+# Одновременные тяжелые запросы: класс -> (не больше запросов сразу, Retry-After в секундах)
+CONCURRENCY_LIMITS = {
+    'import': (2, 30),
+    'provisioning': (1, 60),
+}
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Проверка прайсов перед загрузкой: большие списки товаров проверяются частями в нескольких процессах
+IMPORT_VALIDATION_WORKERS = int(os.getenv('IMPORT_VALIDATION_WORKERS', os.cpu_count() or 1))
+IMPORT_VALIDATION_CHUNK_SIZE = 5000
+
+# Как часто индекс подсказок /products/autocomplete/ проверяет журнал изменений каталога, в секундах
+AUTOCOMPLETE_SYNC_INTERVAL = 5
+
+# Индекс предложений в памяти процесса (NumPy) для фильтров category, shop, in_stock, parameter
+# и сортировки по цене в /products/. Без него те же запросы выполняются в базе
+OFFER_INDEX_ENABLED = os.getenv('OFFER_INDEX_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+OFFER_INDEX_SYNC_INTERVAL = 5
+
+# Потоки, в которых после массового изменения цен (/shop/prices/, /shop/repricing/) пересчитываются
+# лучшие предложения, сводки и индексы
+OFFERS_CHANGED_WORKERS = int(os.getenv('OFFERS_CHANGED_WORKERS', 2))
+
+# Как часто остатки, измененные оформлением заказов, применяются к каталогу (документы, лучшие предложения,
+# сводки), в секундах
+STOCK_SYNC_INTERVAL = 2
+
+# Профили загрузок прайсов (POST /update/<file>/?profile=1)
+IMPORT_PROFILE_DIR = os.getenv('IMPORT_PROFILE_DIR', BASE_DIR / 'var' / 'import_profiles')
+
+# Массовое создание покупателей: хеширование паролей в нескольких процессах, вставка пачками
+PROVISIONING_WORKERS = int(os.getenv('PROVISIONING_WORKERS', os.cpu_count() or 1))
+PROVISIONING_BATCH_SIZE = 1000
+
+# Колоночные выгрузки каталога и заказов (manage.py export_snapshot): строк на запрос и на группу строк файла
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', BASE_DIR / 'var' / 'snapshots')
+SNAPSHOT_CHUNK_SIZE = 50000
+
+# Матрица совместных покупок для расчета связанных товаров
+RECOMMENDATIONS_MATRIX_PATH = os.getenv('RECOMMENDATIONS_MATRIX_PATH', BASE_DIR / 'var' / 'related_products.npz')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -19,9 +19,12 @@ from django.urls import path
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.routers import DefaultRouter
 
+from backend.events import order_events
+
 from backend.views import ShopViewSet, CategoryViewSet, UserRegistrationView, LoginView, \
     ContactView, LogoutView, BasketView, ProductViewSet, SupplierUpdate, ParameterViewSet, OrderViewSet, \
-    CreatingOrderView, ConfirmOrderView
+    CreatingOrderView, ConfirmOrderView, ShopOrderView, ShopOrderStatusView, ShopAnalyticsView, \
+    PriceUpdateView, RepricingView, PriceListValidationView, AccountProvisioningView, ThrottleMetricsView
 
 r = DefaultRouter()
 r.register('shops', ShopViewSet)
@@ -34,6 +37,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('registration/', UserRegistrationView.as_view(), name='registration_user'),
     path('token/', obtain_auth_token),
+    path('accounts/provision/', AccountProvisioningView.as_view(), name='provision_accounts'),
+    path('throttle/metrics/', ThrottleMetricsView.as_view(), name='throttle_metrics'),
     path('login/', LoginView.as_view(), name='login_user'),
     path('logout/', LogoutView.as_view(), name='logout_user'),
     path('contact/', ContactView.as_view(), name='contact'),
@@ -41,4 +46,11 @@ urlpatterns = [
     path('new_order/', CreatingOrderView.as_view(), name='new_order'),
     path('confirm_order/<int:order_id>/', ConfirmOrderView.as_view(), name='confirm_order'),
     path('update/<str:file_name>/', SupplierUpdate.as_view(), name='update'),
+    path('validate/<str:file_name>/', PriceListValidationView.as_view(), name='validate'),
+    path('orders/events/', order_events, name='order_events'),
+    path('shop/orders/', ShopOrderView.as_view(), name='shop_orders'),
+    path('shop/orders/status/', ShopOrderStatusView.as_view(), name='shop_orders_status'),
+    path('shop/prices/', PriceUpdateView.as_view(), name='shop_prices'),
+    path('shop/repricing/', RepricingView.as_view(), name='shop_repricing'),
+    path('shop/analytics/', ShopAnalyticsView.as_view(), name='shop_analytics'),
 ] + r.urls